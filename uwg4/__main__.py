@@ -0,0 +1,4 @@
+"""Run the command line client, see cli.py."""
+from .cli import main
+
+main()
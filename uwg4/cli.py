@@ -0,0 +1,184 @@
+"""Command line access to UWG4 accounts, without Home Assistant.
+
+All accounts run in one process and share one connection pool, output
+is JSON. Sessions are kept in --session-dir so the next run does not
+log in again. Examples:
+    python -m uwg4 -a me@example.com:secret dump
+    python -m uwg4 -a me@example.com:secret -a you@example.com:secret watch
+    python -m uwg4 -a me@example.com:secret set --group "Ground floor" \\
+        --mode manual --temp 18
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import sys
+
+from .client import HOST, UWG4Hub
+from .model import REGMODE_AUTO, REGMODE_COMFORT, REGMODE_MANUAL
+from .polling import RATE_BURST, RATE_LIMIT_PER_MIN
+from .session import JsonStore
+
+SESSION_DIR = os.path.join("~", ".uwg4")
+
+MODES = {
+    "auto": REGMODE_AUTO,
+    "comfort": REGMODE_COMFORT,
+    "manual": REGMODE_MANUAL,
+}
+
+
+def account(value):
+    user, sep, password = value.partition(":")
+    if not sep:
+        raise argparse.ArgumentTypeError("expected USER:PASSWORD")
+    return user, password
+
+
+def thermostats(hub):
+    return [
+        dict(t.to_dict(), account=user)
+        for user, client in hub.accounts.items()
+        for t in client.thermostats.values()
+    ]
+
+
+def output(data):
+    json.dump(data, sys.stdout)
+    sys.stdout.write("\n")
+    sys.stdout.flush()
+
+
+async def dump(hub, args):
+    output(thermostats(hub))
+
+
+async def watch(hub, args):
+    """Print the thermostats once, then a line per changed thermostat
+    with the changed fields (null when removed)."""
+    output(thermostats(hub))
+
+    async def watch_account(user, client):
+        async for serial, changes in client.watch():
+            output({"account": user, "serial": serial, "changes": changes})
+
+    hub.start()
+    await asyncio.gather(*(
+        watch_account(user, client) for user, client in hub.accounts.items()
+    ))
+
+
+async def set_(hub, args):
+    if args.vacation_end is not None:
+        results = await hub.setVacation(
+            args.group, int(args.temp * 100), args.vacation_start,
+            args.vacation_end,
+        )
+    elif args.serial:
+        results = {}
+        for client in hub.accounts.values():
+            results.update(await client.setThermosTemperature(
+                args.serial, MODES[args.mode], _temp(args)
+            ))
+    else:
+        results = await hub.setGroupTemperature(
+            args.group, MODES[args.mode], _temp(args)
+        )
+    output({str(sn): ok for sn, ok in results.items()})
+
+
+def _temp(args):
+    return None if args.temp is None else int(args.temp * 100)
+
+
+async def run(args):
+    session_dir = os.path.expanduser(args.session_dir)
+    os.makedirs(session_dir, exist_ok=True)
+    hub = UWG4Hub(
+        host=args.host, rate_limit=args.rate_limit, rate_burst=args.rate_burst
+    )
+    for user, password in args.account:
+        hub.add_account(
+            user, password,
+            store=JsonStore(os.path.join(session_dir, f"{user}.json")),
+        )
+    try:
+        await hub.connect()
+        await args.command(hub, args)
+    finally:
+        await hub.close()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="uwg4", description=__doc__.splitlines()[0]
+    )
+    parser.add_argument(
+        "-a", "--account", type=account, action="append", default=[],
+        metavar="USER:PASSWORD",
+        help="account to use, can be repeated (default $UWG4_ACCOUNT)",
+    )
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--session-dir", default=SESSION_DIR)
+    parser.add_argument("--rate-limit", type=int, default=RATE_LIMIT_PER_MIN)
+    parser.add_argument("--rate-burst", type=int, default=RATE_BURST)
+    commands = parser.add_subparsers(required=True)
+
+    p = commands.add_parser("dump", help="print all thermostats")
+    p.set_defaults(command=dump)
+    p = commands.add_parser("watch", help="print thermostats as they change")
+    p.set_defaults(command=watch)
+
+    p = commands.add_parser("set", help="set many thermostats at once")
+    p.set_defaults(command=set_)
+    target = p.add_mutually_exclusive_group()
+    target.add_argument("--serial", action="append", help="can be repeated")
+    target.add_argument("--group", help="all thermostats if no target")
+    p.add_argument("--mode", choices=list(MODES), default="manual")
+    p.add_argument("--temp", type=float, help="degrees Celsius")
+    p.add_argument(
+        "--vacation-end", type=datetime.datetime.fromisoformat,
+        help="set vacation mode at --temp until this local time",
+    )
+    p.add_argument(
+        "--vacation-start", type=datetime.datetime.fromisoformat,
+        help="start of the vacation, default now",
+    )
+
+    args = parser.parse_args(argv)
+    if not args.account and os.environ.get("UWG4_ACCOUNT"):
+        args.account = [account(os.environ["UWG4_ACCOUNT"])]
+    if not args.account:
+        parser.error("no account given")
+    users = [user for user, password in args.account]
+    if len(set(users)) != len(users):
+        parser.error("an account is given twice")
+    if args.rate_limit < 1 or args.rate_burst < 1:
+        parser.error("--rate-limit and --rate-burst must be at least 1")
+    if args.command is set_:
+        needs_temp = args.mode != "auto" or args.vacation_end is not None
+        if needs_temp and args.temp is None:
+            parser.error("--temp is required")
+        if args.vacation_end is not None and args.serial:
+            parser.error("vacations are set by --group or for all")
+        if args.vacation_end is not None and args.vacation_end <= max(
+            args.vacation_start or datetime.datetime.now(),
+            datetime.datetime.now(),
+        ):
+            parser.error(
+                "--vacation-end must be after --vacation-start and in the future"
+            )
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    try:
+        asyncio.run(run(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,1128 @@
+"""Client of the mythermostat.info cloud for UWG4/AWG4 thermostats.
+
+Has no dependency on Home Assistant, so scripts can use it directly
+(see cli.py).
+"""
+import asyncio
+import datetime
+import logging
+import threading
+import time
+
+import aiohttp
+
+from .energy import DATE_FORMAT, ENERGY_PATH, decode_energy
+from .flight import SingleFlight
+from .metrics import Metrics
+from .model import (
+    REGMODE_AUTO,
+    REGMODE_COMFORT,
+    REGMODE_MANUAL,
+    REGMODE_VACATION,
+    decode_thermostats,
+    loads,
+    Thermostat,
+)
+from .polling import (
+    POLL_INTERVAL_SEC,
+    RATE_BURST,
+    RATE_LIMIT_PER_MIN,
+    PollScheduler,
+    TokenBucket,
+)
+from .resilience import RETRY_ATTEMPTS, CircuitBreaker, backoff_delay
+from .schedule import SCHEDULE_FIELD, ScheduleCache
+from .session import SessionManager
+from .stream import DeltaStream
+from .tracing import TRACER
+
+_LOGGER = logging.getLogger(__name__)
+
+HOST = "https://mythermostat.info:443"
+USER = "your_usernname"
+PASSWORD = "your_password"
+
+# Time that comfort setting should last (in minutes)
+COMFORT_TIME=90
+# Length of a vacation started from the preset (in days)
+VACATION_DAYS = 7
+
+# Seconds before a request to the server is abandoned.
+REQUEST_TIMEOUT = 10
+# Connections kept open to the server per account, and how long (in
+# seconds) an idle one is kept alive so the TLS handshake is reused.
+POOL_SIZE = 4
+KEEPALIVE_SEC = 5 * 60
+# Connections shared by all accounts of a UWG4Hub, and how many accounts
+# may do their initial login/fetch at the same time.
+HUB_POOL_SIZE = 16
+HUB_CONNECT_LIMIT = 4
+
+# Seconds during which setpoint/preset changes to one thermostat are
+# merged into a single request.
+WRITE_DELAY_SEC = 2
+# Seconds a sent change may stay unconfirmed by polls before it is
+# considered rejected and rolled back.
+WRITE_CONFIRM_SEC = 2 * 60
+# Writes of one account sent at the same time, e.g. by bulk commands.
+WRITE_LIMIT = 4
+# Seconds after a write before its thermostat is fetched to confirm it.
+# Writes sent meanwhile are confirmed together: up to
+# TARGETED_REFRESH_MAX thermostats are fetched one by one, more with a
+# single fetch of the whole account.
+CONFIRM_DELAY_SEC = 5
+TARGETED_REFRESH_MAX = 3
+# Seconds between further fetches of written thermostats the first one
+# did not confirm, until confirmed or rolled back after WRITE_CONFIRM_SEC.
+CONFIRM_RETRY_SEC = 30
+
+# Seconds a read (e.g. an entity update) waits for a refresh before it
+# returns the last known state, the refresh goes on in the background.
+READ_BUDGET_SEC = 2
+# A thermostat is shown as stale once its data is older than this many
+# poll delays.
+STALE_AFTER_POLLS = 2
+
+# Responses meaning the sessionId is not (or no longer) valid.
+AUTH_ERROR_STATUS = (401, 403)
+AUTH_ERROR_CODE = 1
+
+
+class PendingWrite(object):
+    """Setpoint/preset change not yet confirmed by the server."""
+
+    def __init__(self, regmode, temp):
+        self.regmode = regmode
+        self.temp = temp
+        self.task = None
+        self.sending = False  # taken for sending, no longer merged
+        self.sent_at = None  # time.time() the server accepted it
+
+
+class UWG4(object):
+
+    REGMODE_AUTO = REGMODE_AUTO
+    REGMODE_COMFORT = REGMODE_COMFORT
+    REGMODE_MANUAL = REGMODE_MANUAL
+    REGMODE_VACATION = REGMODE_VACATION
+
+    REGMODETXT = [
+        "ERROR",
+        "AUTO",
+        "COMFORT",
+        "MANUAL",
+        "VACATION",
+    ]
+
+    def __init__(
+            self, user=USER, password=PASSWORD, session=None, host=HOST,
+            timeout=REQUEST_TIMEOUT, recorder=None,
+            write_delay=WRITE_DELAY_SEC, interval=POLL_INTERVAL_SEC,
+            rate_limit=RATE_LIMIT_PER_MIN, rate_burst=RATE_BURST, store=None,
+            breaker=None, read_budget=READ_BUDGET_SEC
+    ):
+        self.user = user
+        self._password = password
+        self.host = host
+        self.sessions = SessionManager(self._authenticate, store)
+        self.thermostats = {}  # serial number -> Thermostat, as shown
+        self.groups = {}  # group name -> list of serial numbers
+        self.schedules = ScheduleCache()
+        self._listeners = {}  # serial number (None for all) -> callbacks
+        self._registry_listeners = []
+        self._streams = []  # DeltaStream of each watch()
+        self._session = session
+        self._own_session = session is None
+        self._timeout = aiohttp.ClientTimeout(total=timeout)
+        self.recorder = recorder
+        self.write_delay = write_delay
+        self._writes = {}  # serial number -> PendingWrite
+        self._write_limit = asyncio.Semaphore(WRITE_LIMIT)
+        self._polled = {}  # serial number -> Thermostat, as polled
+        self.polled_at = {}  # serial number -> time.time() of its poll
+        self._stale = set()  # serial numbers whose data is too old
+        self.read_budget = read_budget
+        self.write_errors = {}  # serial number -> last failed write
+        # Update frequency is secured to no spam the servers
+        # and then get the account blacklisted.
+        self.bucket = TokenBucket(rate_limit / 60, rate_burst)
+        self.scheduler = PollScheduler(interval)
+        self.metrics = Metrics()
+        # Requests fail fast while the cloud is down, the last polled
+        # state stays in use meanwhile.
+        self.breaker = CircuitBreaker() if breaker is None else breaker
+        self._poll_task = None
+        self._confirming = set()  # serial numbers written, to fetch
+        self._confirm_task = None
+        self._confirm_due = None  # time.monotonic() of the next fetch
+        self._closing = False
+        # Concurrent fetches of the account share one request.
+        self._fetch = SingleFlight(self._getData)
+        self._refresh = SingleFlight(self._do_refresh)
+
+    async def connect(self):
+        """Restore or open a session and do the initial data gathering."""
+        await self.sessions.load()
+        await self.refresh()
+
+    @property
+    def sessionId(self):
+        return self.sessions.session_id
+
+    @property
+    def list_of_thermos(self):
+        return list(self.thermostats.values())
+
+    async def close(self):
+        """Stop polling, send queued writes and close the connection
+        pool if it is owned by this account."""
+        self._closing = True
+        if self._poll_task is not None:
+            self._poll_task.cancel()
+            self._poll_task = None
+        tasks = [w.task for w in self._writes.values()]
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+        # Only now, the writes above start confirm fetches.
+        if self._confirm_task is not None:
+            self._confirm_task.cancel()
+            self._confirm_task = None
+        self._confirming.clear()
+        if self._own_session and self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def _get_session(self):
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=POOL_SIZE, keepalive_timeout=KEEPALIVE_SEC
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector, timeout=self._timeout,
+                trace_configs=[TRACER.trace_config()],
+            )
+            self._own_session = True
+        return self._session
+
+    async def _request(self, method, path, **kwargs):
+        """Send a request over the pooled session.
+
+        Requests the server fails (no answer or status 5xx) are retried
+        after a random, growing delay. Returns (status, body) where body
+        is the raw response, both are None if the request could not be
+        completed or the circuit breaker refused it.
+        """
+        status = body = None
+        for attempt in range(RETRY_ATTEMPTS):
+            if attempt:
+                self.metrics.retries += 1
+                await asyncio.sleep(backoff_delay(attempt - 1))
+            if not self.breaker.allow():
+                self.metrics.rejected += 1
+                self.log(f"Request {path} refused, the cloud is down")
+                return None, None
+            try:
+                await self.bucket.acquire()
+                status, body = await self._send(method, path, **kwargs)
+            except BaseException:
+                # Do not keep the probe slot if it never got an answer.
+                self.breaker.release()
+                raise
+            if status is not None and status < 500:
+                if self.breaker.success():
+                    self.logerr("The cloud answers again")
+                return status, body
+            if self.breaker.failure():
+                self.logerr(
+                    "The cloud keeps failing, requests are paused for "
+                    f"{self.breaker.retry_in:.0f} seconds"
+                )
+            if self.breaker.rejecting:
+                break
+        return status, body
+
+    async def _send(self, method, path, **kwargs):
+        session = self._get_session()
+        status = body = None
+        start = time.perf_counter()
+        try:
+            with TRACER.span("request"):
+                async with session.request(
+                    method, self.host + path, timeout=self._timeout, **kwargs
+                ) as r:
+                    with TRACER.span("read"):
+                        status, body = r.status, await r.read()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as err:
+            self.logerr(f"Request {path} failed: {err!r}")
+        self.metrics.request(
+            path, 1000 * (time.perf_counter() - start), status,
+            None if body is None else len(body),
+        )
+        return status, body
+
+    async def _call(self, method, path, params=None, **kwargs):
+        """Send a request with the account's sessionId.
+
+        If the server rejects the session, log in again (shared with
+        concurrent callers) and retry once. Returns (ok, res, body) with
+        res the decoded JSON response.
+        """
+        if self.breaker.rejecting:
+            self.metrics.rejected += 1
+            return False, None, None
+        params = dict(params or {})
+        for attempt in range(2):
+            session_id = await self.sessions.get()
+            if session_id is None:
+                self.log(
+                    f"Request {path} skipped, no session (next login in "
+                    f"{self.sessions.retry_in:.0f} s)"
+                )
+                return False, None, None
+            params["sessionid"] = session_id
+            status, body = await self._request(
+                method, path, params=params, **kwargs
+            )
+            res = None
+            if body is not None:
+                try:
+                    with TRACER.span("parse"):
+                        res = loads(body)
+                except ValueError:
+                    pass
+            auth_error = status in AUTH_ERROR_STATUS or (
+                isinstance(res, dict) and res.get("ErrorCode") == AUTH_ERROR_CODE
+            )
+            if not auth_error:
+                break
+            if attempt == 0:
+                self.metrics.retries += 1
+                await self.sessions.renew(session_id)
+        ok = status is not None and status < 400 and res is not None
+        return ok and not auth_error, res, body
+
+    def log(self, msg):
+        _LOGGER.debug(msg)
+
+    def logerr(self, msg):
+        _LOGGER.warning(msg)
+
+    async def login(self):
+        """Log in now, or wait for a login already in progress."""
+        return await self.sessions.renew()
+
+    async def _authenticate(self):
+        with TRACER.span("login"):
+            user = self.user
+            psw = self._password
+            path = "/api/authenticate/user"
+
+            data = {
+                "Application": 2,
+                "Confirm": "",
+                "Email": user,
+                "Password": psw,
+            }
+            status, body = await self._request("POST", path, json=data)
+            if status is not None and status < 400:
+                try:
+                    res = loads(body)
+                except ValueError:
+                    res = None
+                if not isinstance(res, dict) or "ErrorCode" not in res:
+                    self.logerr("Failed to decode login response")
+                elif res["ErrorCode"] == 0:
+                    self.log(f"Logged in with username {user}")
+                    return res["SessionId"]
+                else:
+                    self.logerr(f"Failed to login, error code { res['ErrorCode']}")
+            else:
+                self.logerr("Failed to execute login request")
+            return None
+
+    async def setThermoTemperature(
+            self, thermo_sn, mode, temp, begin=None, end=None
+    ):
+        """Send a mode and temperature to thermo_sn, returns True on
+        success. begin and end (local datetimes) are the vacation dates,
+        by default from now for VACATION_DAYS."""
+        with TRACER.span("setThermoTemperature"):
+            if mode == self.REGMODE_MANUAL:
+                data = {
+                    "RegulationMode": mode,
+                    "ManualTemperature": temp,
+                }
+            elif mode == self.REGMODE_COMFORT:
+                td = datetime.timedelta(minutes=COMFORT_TIME)
+                d = datetime.datetime.utcnow()
+                e = d + td
+                comfort_end = e.strftime("%d/%m/%Y %H:%M:00 +00:00")
+                data = {
+                    "RegulationMode": mode,
+                    "ComfortTemperature": temp,
+                    "ComfortEndTime": comfort_end,
+                }
+            elif mode == self.REGMODE_VACATION:
+                now = datetime.datetime.now()
+                if begin is None:
+                    begin = now
+                if end is None:
+                    end = begin + datetime.timedelta(days=VACATION_DAYS)
+                # The server starts and ends the vacation by itself.
+                data = {
+                    "VacationEnabled": True,
+                    "VacationTemperature": temp,
+                    "VacationBeginDay": begin.strftime(DATE_FORMAT),
+                    "VacationEndDay": end.strftime(DATE_FORMAT),
+                }
+                if begin <= now:
+                    data["RegulationMode"] = mode
+            else:
+                # For everything else (including AUTO), just set AUTO.
+                data = {
+                    "RegulationMode": self.REGMODE_AUTO,
+                }
+            return await self._post_thermo(thermo_sn, data)
+
+    async def _post_thermo(self, thermo_sn, data):
+        """Send settings data to thermo_sn, returns True on success."""
+        path = "/api/thermostat"
+        params = {"serialnumber": thermo_sn}
+        ok, res, body = await self._call("POST", path, params, json=data)
+        if not ok or res.get("Success") != True:
+            self.logerr(f"Operation failed on {thermo_sn}")
+            return False
+        return True
+
+    async def setVacation(self, serials, temp, begin=None, end=None):
+        """Put many thermostats in vacation mode at temp from begin to
+        end (local datetimes, by default from now for VACATION_DAYS).
+
+        The server switches the thermostats in and out of vacation, so
+        nothing has to be sent when it starts or ends. Writes are sent
+        WRITE_LIMIT at a time. Returns {serial number: success}. Raises
+        ValueError if end is not after begin or is in the past.
+        """
+        now = datetime.datetime.now()
+        if end is not None and end <= max(begin or now, now):
+            raise ValueError(
+                "The vacation must end after it starts and in the future"
+            )
+        return await self._write_many(
+            serials, self.setThermoTemperature, self.REGMODE_VACATION, temp,
+            begin, end,
+        )
+
+    async def cancelVacation(self, serials):
+        """End the vacation of many thermostats, they return to their
+        schedule. Returns {serial number: success}."""
+        data = {"VacationEnabled": False, "RegulationMode": self.REGMODE_AUTO}
+        return await self._write_many(serials, self._post_thermo, data)
+
+    async def _write_many(self, serials, write, *args):
+        """Call write(serial number, *args) for the known serials,
+        WRITE_LIMIT at a time, and poll soon to show the result."""
+        serials = [sn for sn in serials if sn in self.thermostats]
+
+        async def write_one(sn):
+            async with self._write_limit:
+                return await write(sn, *args)
+
+        results = await asyncio.gather(*(write_one(sn) for sn in serials))
+        self._start_confirm(
+            sn for sn, ok in zip(serials, results) if ok
+        )
+        return dict(zip(serials, results))
+
+    def queueThermoTemperature(self, thermo_sn, mode, temp):
+        """Queue a setpoint/preset change for thermo_sn.
+
+        Changes queued within write_delay seconds of each other are
+        merged, only the last mode and temperature are sent. The change
+        is shown right away and kept until a poll confirms it, or rolled
+        back if the server does not apply it. Returns the task that
+        sends the write.
+        """
+        write = self._writes.get(thermo_sn)
+        if write is not None and not write.sending:
+            write.regmode = mode
+            write.temp = temp
+        else:
+            write = self._writes[thermo_sn] = PendingWrite(mode, temp)
+            write.task = asyncio.get_running_loop().create_task(
+                self._flush_write(thermo_sn, write)
+            )
+        self.write_errors.pop(thermo_sn, None)
+        self._apply(thermo_sn)
+        self._notify(thermo_sn)
+        return write.task
+
+    async def _flush_write(self, thermo_sn, write):
+        await asyncio.sleep(self.write_delay)
+        async with self._write_limit:
+            write.sending = True
+            ok = await self.setThermoTemperature(
+                thermo_sn, write.regmode, write.temp
+            )
+        if ok:
+            # Polls only judge the write from now on: it may have waited
+            # long for a free slot, a token or a retry.
+            write.sent_at = time.time()
+            self.write_errors.pop(thermo_sn, None)
+            self._start_confirm([thermo_sn])
+        elif self._writes.get(thermo_sn) is write:
+            self._write_failed(thermo_sn, "Failed to send the change")
+            self._apply(thermo_sn)
+            self._notify(thermo_sn)
+        return ok
+
+    def _start_confirm(self, serials, delay=CONFIRM_DELAY_SEC):
+        """Fetch the written thermostats serials after delay seconds,
+        together with the ones written meanwhile."""
+        if self._closing:
+            return
+        self._confirming.update(serials)
+        if not self._confirming:
+            return
+        due = time.monotonic() + delay
+        if self._confirm_task is not None:
+            if self._confirm_due <= due:
+                return
+            # A new write should not wait for a later retry.
+            self._confirm_task.cancel()
+        self._confirm_due = due
+        self._confirm_task = asyncio.get_running_loop().create_task(
+            self._confirm(delay)
+        )
+
+    async def _confirm(self, delay):
+        await asyncio.sleep(delay)
+        serials = self._confirming
+        self._confirming = set()
+        self._confirm_task = None
+        if len(serials) > TARGETED_REFRESH_MAX:
+            await self.refresh()
+        else:
+            await self.refreshThermostats(serials)
+        # The regular poll may be minutes away, fetch the writes not
+        # confirmed yet again so they are confirmed or rolled back in
+        # time.
+        self._start_confirm(
+            [
+                sn for sn in serials
+                if sn in self._writes and self._writes[sn].sent_at is not None
+            ],
+            CONFIRM_RETRY_SEC,
+        )
+
+    async def setThermosTemperature(self, serials, mode, temp):
+        """Set the mode and temperature of many thermostats at once.
+
+        The changes go through queueThermoTemperature(), so they show
+        right away and are sent WRITE_LIMIT at a time. Thermostats
+        already in that state are not written. Returns {serial number:
+        success}.
+        """
+        serials = [sn for sn in serials if sn in self.thermostats]
+        tasks = {}
+        for sn in serials:
+            thermo = self.thermostats[sn]
+            if sn not in self._writes and thermo.regmode == mode and (
+                mode == self.REGMODE_AUTO
+                or round(thermo.setpoint * 100) == temp
+            ):
+                continue
+            tasks[sn] = self.queueThermoTemperature(sn, mode, temp)
+        results = await asyncio.gather(*tasks.values())
+        done = dict(zip(tasks, results))
+        return {sn: done.get(sn, True) for sn in serials}
+
+    async def setGroupTemperature(self, group, mode, temp):
+        """Set the mode and temperature of all thermostats of group,
+        see setThermosTemperature()."""
+        return await self.setThermosTemperature(
+            self.groups.get(group, ()), mode, temp
+        )
+
+    async def setAllTemperature(self, mode, temp):
+        """Set the mode and temperature of every thermostat of the
+        account, see setThermosTemperature()."""
+        return await self.setThermosTemperature(
+            list(self.thermostats), mode, temp
+        )
+
+    def _write_failed(self, thermo_sn, msg):
+        """Drop the pending write of thermo_sn and record why."""
+        del self._writes[thermo_sn]
+        self.logerr(f"Thermostat {thermo_sn}: {msg}")
+        self.write_errors[thermo_sn] = msg
+
+    def _reconcile(self, thermo_sn, regmode, setpoint):
+        """Check a sent write of thermo_sn against polled values.
+
+        Returns True if the write was rolled back.
+        """
+        write = self._writes.get(thermo_sn)
+        if write is None or write.sent_at is None:
+            return False
+        if write.regmode == regmode and (
+            regmode == self.REGMODE_AUTO or write.temp == round(setpoint * 100)
+        ):
+            del self._writes[thermo_sn]
+            return False
+        if time.time() - write.sent_at > WRITE_CONFIRM_SEC:
+            self._write_failed(thermo_sn, "The server did not apply the change")
+            return True
+        return False
+
+    def _apply(self, thermo_sn):
+        """Update thermostat thermo_sn from the last polled values, with
+        any pending write on top. Returns True if anything changed."""
+        thermo = self._polled.get(thermo_sn)
+        if thermo is None:
+            return False
+        write = self._writes.get(thermo_sn)
+        if write is not None:
+            setpoint = thermo.setpoint
+            if write.regmode != self.REGMODE_AUTO:
+                setpoint = write.temp / 100
+            thermo = thermo.with_setting(write.regmode, setpoint)
+        old = self.thermostats.get(thermo_sn)
+        if old is not None and old.key() == thermo.key():
+            return False
+        self.thermostats[thermo_sn] = thermo
+        return True
+
+    def _notify(self, thermo_sn):
+        for stream in self._streams:
+            stream.mark(thermo_sn)
+        for callback in list(self._listeners.get(thermo_sn, ())):
+            callback()
+
+    def getSchedule(self, thermo_sn):
+        """Return the cached Schedule of thermo_sn, None if unknown."""
+        return self.schedules.get(thermo_sn)
+
+    async def setSchedule(self, thermo_sn, schedule):
+        """Upload schedule (a Schedule) to thermo_sn, returns True on
+        success. The cache is updated from what was sent, so the
+        schedule is not fetched again."""
+        if not await self._post_thermo(
+            thermo_sn, {SCHEDULE_FIELD: schedule.data}
+        ):
+            return False
+        self.schedules.put(thermo_sn, schedule)
+        return True
+
+    async def setSchedules(self, schedules):
+        """Upload many schedules at once, schedules maps serial numbers
+        to Schedule.
+
+        Only the schedules that differ from the cached ones are sent,
+        concurrently. Returns {serial number: success} of those sent.
+        """
+        versions = self.schedules.versions()
+        changed = [
+            (sn, schedule) for sn, schedule in schedules.items()
+            if versions.get(sn) != schedule.version
+        ]
+        results = await asyncio.gather(*(
+            self.setSchedule(sn, schedule) for sn, schedule in changed
+        ))
+        return {sn: ok for (sn, schedule), ok in zip(changed, results)}
+
+    async def getEnergy(self, thermo_sn, start, end):
+        """Fetch the hourly energy use of thermo_sn from start to end
+        (UTC datetimes). Returns a list of (timestamp, kWh), or None on
+        failure."""
+        params = {
+            "serialnumber": thermo_sn,
+            "from": start.strftime(DATE_FORMAT),
+            "to": end.strftime(DATE_FORMAT),
+        }
+        ok, res, body = await self._call("GET", ENERGY_PATH, params)
+        if not ok or "EnergyUsage" not in res:
+            self.logerr(f"Failed to get energy use of {thermo_sn}")
+            return None
+        return decode_energy(res)
+
+    async def getThermostat(self, thermo_sn):
+        """Fetch one thermostat, returns a Thermostat record or None on
+        failure."""
+        path = "/api/thermostat"
+        params = {"serialnumber": thermo_sn}
+        ok, res, body = await self._call("GET", path, params)
+        if not ok or "SerialNumber" not in res:
+            self.logerr(f"Failed to get thermostat {thermo_sn}")
+            return None
+        if SCHEDULE_FIELD in res:
+            self.schedules.update_one(thermo_sn, res[SCHEDULE_FIELD])
+        # The response of a single thermostat has no group.
+        old = self._polled.get(thermo_sn)
+        return Thermostat.from_json(res, None if old is None else old.group)
+
+    async def getData(self):
+        """Fetch the account, returns a list of Thermostat records or
+        None on failure. Concurrent callers share one request."""
+        return await self._fetch()
+
+    async def _getData(self):
+        with TRACER.span("getData"):
+            path = "/api/thermostats"
+
+            ok, res, body = await self._call("GET", path)
+            if not ok:
+                self.logerr("Failed to execute request ")
+                return
+
+            if "Groups" in res:
+                found = 0
+                for group in res["Groups"]:
+                    if "Thermostats" in group:
+                        found = found + 1
+                if found == 0:
+                    self.logerr("Failed to retrieve any thermostats")
+                    return
+            else:
+                self.logerr("Failed to get group information")
+                return
+
+            if self.recorder is not None:
+                self.recorder.record(body)
+            with TRACER.span("schedules"):
+                self.schedules.update(res)
+            with TRACER.span("decode"):
+                return decode_thermostats(res)
+
+    def add_listener(self, callback, serial=None):
+        """Subscribe callback to be called after every refresh that
+        changed any thermostat, or only thermostat serial if given.
+
+        Returns a function that removes the subscription.
+        """
+        listeners = self._listeners.setdefault(serial, [])
+        listeners.append(callback)
+
+        def remove_listener():
+            listeners.remove(callback)
+
+        return remove_listener
+
+    async def watch(self, serials=None, initial=False):
+        """Yield (serial number, {field: new value}) for every change of
+        the thermostats, or of only serials if given. The value is None
+        when a thermostat is removed.
+
+        All watchers are fed by the account's single poll, nothing is
+        fetched for them. A consumer that falls behind gets the changes
+        of a thermostat merged into one delta. With initial, all fields
+        of every thermostat are yielded first.
+        """
+        stream = DeltaStream(self, serials, initial)
+        self._streams.append(stream)
+        try:
+            async for change in stream:
+                yield change
+        finally:
+            self._streams.remove(stream)
+
+    def add_registry_listener(self, callback):
+        """Subscribe callback(added, removed) to thermostats that appear
+        in or disappear from the account.
+
+        Returns a function that removes the subscription.
+        """
+        self._registry_listeners.append(callback)
+
+        def remove_listener():
+            self._registry_listeners.remove(callback)
+
+        return remove_listener
+
+    async def refresh(self):
+        """Fetch the account once and push the result to all listeners.
+
+        This is the only place that polls the whole account, so the
+        number of requests does not depend on the number of thermostats.
+        A refresh requested while one is running waits for that one.
+        """
+        await self._refresh()
+
+    async def _do_refresh(self):
+        with TRACER.span("refresh"):
+            start = time.perf_counter()
+            records = await self.getData()
+            self.metrics.polled(
+                1000 * (time.perf_counter() - start), records is not None
+            )
+            if records is None:
+                self._check_stale()
+                return
+            with TRACER.span("update_registry"):
+                changed = self._update_registry(records)
+            busy = bool(self._writes) or any(
+                t.heating and t.online for t in self._polled.values()
+            )
+            self.scheduler.polled(busy)
+            with TRACER.span("notify"):
+                self._changed(changed)
+            self._check_stale()
+
+    def is_stale(self, thermo_sn):
+        """Return True if the data of thermo_sn is too old to trust."""
+        return thermo_sn in self._stale
+
+    def _check_stale(self, now=None):
+        """Find the thermostats not polled for STALE_AFTER_POLLS poll
+        delays, and tell those that start or stop being stale so the
+        change shows without waiting for new data."""
+        limit = STALE_AFTER_POLLS * max(
+            self.scheduler.interval, self.scheduler.next_delay()
+        )
+        stale = set()
+        for sn in self.thermostats:
+            age = self.data_age(sn, now)
+            if age is None or age > limit:
+                stale.add(sn)
+        flipped = stale ^ self._stale
+        self._stale = stale
+        self._changed([sn for sn in flipped if sn in self.thermostats])
+
+    def data_age(self, thermo_sn, now=None):
+        """Seconds since thermo_sn was last polled, None if unknown."""
+        polled_at = self.polled_at.get(thermo_sn)
+        if polled_at is None:
+            return None
+        if now is None:
+            now = time.time()
+        return now - polled_at
+
+    async def read(self, budget=None):
+        """Return the thermostats after a refresh, or the last known
+        state if the refresh takes longer than budget seconds (by
+        default read_budget). A late refresh still completes and
+        pushes its result to the listeners."""
+        if budget is None:
+            budget = self.read_budget
+        task = self._refresh.start()
+        try:
+            await asyncio.wait_for(asyncio.shield(task), budget)
+        except asyncio.TimeoutError:
+            self.metrics.stale_reads += 1
+        return self.list_of_thermos
+
+    async def refreshThermostats(self, serials):
+        """Fetch only the thermostats serials and merge them into the
+        known state, e.g. to confirm writes without fetching the whole
+        account. Returns the serial numbers that changed."""
+        serials = [sn for sn in serials if sn in self._polled]
+        records = await asyncio.gather(
+            *(self.getThermostat(sn) for sn in serials)
+        )
+        changed = []
+        for sn, thermo in zip(serials, records):
+            old = self._polled.get(sn)
+            if thermo is None or old is None:
+                continue
+            if old.heating != thermo.heating:
+                self.scheduler.boost()
+            self._polled[sn] = thermo
+            self.polled_at[sn] = time.time()
+            rolled_back = self._reconcile(sn, thermo.regmode, thermo.setpoint)
+            if self._apply(sn) or rolled_back:
+                changed.append(sn)
+        self._changed(changed)
+        return changed
+
+    def _changed(self, changed):
+        """Call the listeners of the serial numbers changed."""
+        if changed:
+            for callback in list(self._listeners.get(None, ())):
+                callback()
+        for sn in changed:
+            self._notify(sn)
+
+    def diagnostics(self):
+        """Return performance counters and client state as JSON data,
+        without credentials or session."""
+        return {
+            "thermostats": len(self.thermostats),
+            "groups": len(self.groups),
+            "logins": self.sessions.login_count,
+            "login_failures": self.sessions.login_failures,
+            "rate_budget": round(self.bucket.tokens, 1),
+            "poll_interval_s": self.scheduler.next_delay(),
+            "pending_writes": len(self._writes),
+            "stale": len(self._stale),
+            "shared_fetches": self._fetch.joined + self._refresh.joined,
+            "write_errors": dict(self.write_errors),
+            "breaker": self.breaker.state,
+            "metrics": self.metrics.as_dict(),
+        }
+
+    def snapshot(self):
+        """Return the last polled state as JSON data for restore()."""
+        return {
+            "thermostats": [t.to_list() for t in self._polled.values()],
+            "schedules": self.schedules.snapshot(),
+            "polled_at": [[sn, t] for sn, t in self.polled_at.items()],
+        }
+
+    def restore(self, data):
+        """Create the thermostats saved by snapshot(), so they exist
+        before the first poll. Does nothing once polled."""
+        if not data or self._polled:
+            return
+        self.schedules.restore(data.get("schedules", ()))
+        self.polled_at.update(data.get("polled_at", ()))
+        added = []
+        for fields in data["thermostats"]:
+            thermo = Thermostat(*fields)
+            self._polled[thermo.serial] = thermo
+            self.groups.setdefault(thermo.group, []).append(thermo.serial)
+            self._apply(thermo.serial)
+            added.append(self.thermostats[thermo.serial])
+        self._check_stale()
+        self._registry_changed(added, [])
+
+    def start(self, delay=None):
+        """Start polling in the background, until close().
+
+        delay is the time until the first poll, by default the normal
+        scheduler delay.
+        """
+        if self._poll_task is None:
+            self._poll_task = asyncio.get_running_loop().create_task(
+                self.run(delay)
+            )
+
+    async def run(self, delay=None):
+        """Poll the account at the pace chosen by the scheduler."""
+        while True:
+            if delay is None:
+                delay = self.scheduler.next_delay()
+            await asyncio.sleep(delay)
+            delay = None
+            try:
+                await self.refresh()
+            except Exception:
+                # Keep polling, the next answer may be good again.
+                _LOGGER.exception(f"Polling {self.user} failed")
+                self._check_stale()
+
+    def getThermoInfo(self, data=None):
+        """Return the thermostats, after updating them from the
+        /api/thermostats response data if given."""
+        with TRACER.span("getThermoInfo"):
+            if data is not None:
+                self.schedules.update(data)
+                self._update_registry(decode_thermostats(data))
+            return self.list_of_thermos
+
+    def _update_registry(self, records):
+        """Update the registry from polled Thermostat records.
+
+        Returns the serial numbers of the thermostats that changed.
+        """
+        groups = {}
+        added = []
+        changed = []
+        polled = {}
+        for thermo in records:
+            sn = thermo.serial
+            polled[sn] = thermo
+            groups.setdefault(thermo.group, []).append(sn)
+            old = self._polled.get(sn)
+            if old is not None and old.heating != thermo.heating:
+                self.scheduler.boost()
+            self._polled[sn] = thermo
+            rolled_back = self._reconcile(sn, thermo.regmode, thermo.setpoint)
+            if self._apply(sn) or rolled_back:
+                changed.append(sn)
+                if old is None:
+                    # print(f"Adding {thermo.name}")
+                    added.append(self.thermostats[sn])
+
+        removed = []
+        for sn in list(self.thermostats):
+            if sn not in polled:
+                removed.append(self.thermostats.pop(sn))
+                self._writes.pop(sn, None)
+        self._polled = polled
+        self.polled_at = dict.fromkeys(polled, time.time())
+        self.groups = groups
+        self._registry_changed(added, removed)
+
+        return changed
+
+    def _registry_changed(self, added, removed):
+        for thermo in removed:
+            for stream in self._streams:
+                stream.mark(thermo.serial)
+        if added or removed:
+            for callback in list(self._registry_listeners):
+                callback(added, removed)
+
+
+class UWG4Hub(object):
+    """Run many accounts side by side.
+
+    All accounts share one connection pool and event loop, each keeps
+    its own session, rate limit and poll schedule. options are passed
+    to every UWG4.
+    """
+
+    def __init__(self, session=None, **options):
+        self._session = session
+        self._own_session = session is None
+        self._options = options
+        self.accounts = {}  # user -> UWG4
+        # All accounts talk to the same cloud, one breaker stops them all.
+        self.breaker = CircuitBreaker()
+
+    def _get_session(self):
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=HUB_POOL_SIZE, keepalive_timeout=KEEPALIVE_SEC
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector, trace_configs=[TRACER.trace_config()]
+            )
+            self._own_session = True
+        return self._session
+
+    def add_account(self, user, password, **options):
+        """Create the client of an account, options override the hub's.
+        Raises ValueError if the account was already added."""
+        if user in self.accounts:
+            raise ValueError(f"Account {user} added twice")
+        options = dict(self._options, **options)
+        options.setdefault("breaker", self.breaker)
+        account = UWG4(user, password, session=self._get_session(), **options)
+        self.accounts[user] = account
+        return account
+
+    async def connect(self):
+        """Do the initial data gathering of all accounts, a few at a time."""
+        limit = asyncio.Semaphore(HUB_CONNECT_LIMIT)
+
+        async def connect(account):
+            async with limit:
+                await account.connect()
+
+        accounts = list(self.accounts.values())
+        results = await asyncio.gather(
+            *(connect(a) for a in accounts), return_exceptions=True,
+        )
+        for account, result in zip(accounts, results):
+            if isinstance(result, Exception):
+                _LOGGER.error(
+                    f"Initial update of {account.user} failed",
+                    exc_info=result,
+                )
+
+    async def setGroupTemperature(self, group, mode, temp):
+        """Set group of every account, or all thermostats if group is
+        None. Returns {serial number: success}."""
+        return await self._write_group(
+            group, lambda a, sn: a.setThermosTemperature(sn, mode, temp)
+        )
+
+    async def setVacation(self, group, temp, begin=None, end=None):
+        """Put group of every account, or all thermostats if group is
+        None, in vacation mode. Returns {serial number: success}."""
+        return await self._write_group(
+            group, lambda a, sn: a.setVacation(sn, temp, begin, end)
+        )
+
+    async def cancelVacation(self, group):
+        """End the vacation of group of every account, or of all
+        thermostats if group is None."""
+        return await self._write_group(
+            group, lambda a, sn: a.cancelVacation(sn)
+        )
+
+    async def _write_group(self, group, write):
+        """Call write(account, serial numbers) for the thermostats of
+        group in every account, and merge the results."""
+        calls = []
+        for account in self.accounts.values():
+            if group is None:
+                serials = list(account.thermostats)
+            else:
+                serials = account.groups.get(group, ())
+            calls.append(write(account, serials))
+        results = {}
+        for result in await asyncio.gather(*calls):
+            results.update(result)
+        return results
+
+    def diagnostics(self):
+        """Return the diagnostics of all accounts, in order."""
+        return [a.diagnostics() for a in self.accounts.values()]
+
+    def start(self):
+        """Start polling all accounts, spread over the poll interval so
+        they do not hit the server at the same time."""
+        accounts = list(self.accounts.values())
+        for i, account in enumerate(accounts):
+            account.start(i * account.scheduler.interval / len(accounts))
+
+    async def close(self):
+        await asyncio.gather(
+            *(a.close() for a in self.accounts.values()),
+            return_exceptions=True,
+        )
+        if self._own_session and self._session is not None:
+            await self._session.close()
+            self._session = None
+
+
+class UWG4Sync(object):
+    """Blocking wrapper around UWG4 for scripts.
+
+    The client runs in an event loop on its own thread, every method
+    hands its call over to that loop. So the wrapper can be shared by
+    many threads, their concurrent fetches and logins are merged like
+    those of async callers.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self._loop.run_forever, name="uwg4", daemon=True
+        )
+        self._thread.start()
+        self.client = self._run(self._connect(*args, **kwargs))
+
+    async def _connect(self, *args, **kwargs):
+        client = UWG4(*args, **kwargs)
+        await client.connect()
+        return client
+
+    def _run(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+    async def _call(self, func, *args):
+        return func(*args)
+
+    def login(self):
+        return self._run(self.client.login())
+
+    def getData(self):
+        return self._run(self.client.getData())
+
+    def refresh(self):
+        return self._run(self.client.refresh())
+
+    def setThermoTemperature(self, thermo_sn, mode, temp):
+        return self._run(self.client.setThermoTemperature(thermo_sn, mode, temp))
+
+    def getThermoInfo(self, data=None):
+        return self._run(self._call(self.client.getThermoInfo, data))
+
+    def close(self):
+        self._run(self.client.close())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
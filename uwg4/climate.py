@@ -1,247 +1,332 @@
 """Platform for sensor integration."""
+from datetime import timedelta
+from typing import Optional
+
+import voluptuous as vol
+
+from homeassistant.const import (
+    Platform,
+    ATTR_TEMPERATURE,
+    CONF_MODE,
+    CONF_PASSWORD,
+    CONF_SCAN_INTERVAL,
+    CONF_TIMEOUT,
+    CONF_USERNAME,
+    EVENT_HOMEASSISTANT_STOP,
+    UnitOfTemperature,
+)
+from homeassistant.core import SupportsResponse, callback
+from homeassistant.exceptions import HomeAssistantError
+import homeassistant.helpers.config_validation as cv
+
+from homeassistant.helpers.discovery import async_load_platform
+from homeassistant.helpers.storage import Store
+from homeassistant.setup import async_when_setup_or_start
+from homeassistant.util import slugify
+import homeassistant.util.dt as dt_util
+
+from .const import (
+    DOMAIN,
+    CONF_ACCOUNTS,
+    CONF_ENERGY,
+    CONF_PROFILE,
+    CONF_RATE_BURST,
+    CONF_RATE_LIMIT,
+    CONF_READ_BUDGET,
+    CONF_SNAPSHOT_COUNT,
+    CONF_SNAPSHOT_DIR,
+)
 
+from homeassistant.components.climate import (
+    PLATFORM_SCHEMA,
+    ClimateEntity,
+    ClimateEntityFeature,
+    HVACAction,
+    HVACMode,
+)
 
-import datetime
-import time
-import requests
-import json
+from .client import (
+    COMFORT_TIME,
+    READ_BUDGET_SEC,
+    REQUEST_TIMEOUT,
+    UWG4,
+    UWG4Hub,
+)
+from .model import REGMODE_AUTO, REGMODE_COMFORT, REGMODE_MANUAL
+from .polling import POLL_INTERVAL_SEC, RATE_BURST, RATE_LIMIT_PER_MIN
+from .recorder import SNAPSHOT_KEEP, SnapshotRecorder
+from .tracing import TRACER, SpanSampler
 
-HOST = "https://mythermostat.info:443"
-USER = "your_usernname"
-PASSWORD = "your_password"
 
-# Time that comfort setting should last (in minutes)
-COMFORT_TIME=90
+DEFAULT_MAX_TEMP = 25.0
+DEFAULT_MIN_TEMP = 5.0
 
-# Update frequency is secured to no spam the servers
-# and then get the account blacklisted.
-UPDATE_RATE_SEC = 1 * 60
+SCAN_INTERVAL = timedelta(seconds=POLL_INTERVAL_SEC)
+
+# Seconds state changes are collected before the cached state is saved.
+STATE_SAVE_DELAY = 5 * 60
+
+SERVICE_DIAGNOSTICS = "diagnostics"
+SERVICE_PROFILE = "profile"
+SERVICE_SET_GROUP = "set_group"
+SERVICE_SET_VACATION = "set_vacation"
+SERVICE_CANCEL_VACATION = "cancel_vacation"
+
+ATTR_GROUP = "group"
+ATTR_START = "start"
+ATTR_END = "end"
+# Modes of the set_group service.
+SERVICE_MODES = {
+    "auto": REGMODE_AUTO,
+    "comfort": REGMODE_COMFORT,
+    "manual": REGMODE_MANUAL,
+}
+
+SET_GROUP_SCHEMA = vol.Schema(
+    {
+        vol.Optional(ATTR_GROUP): cv.string,
+        vol.Required(CONF_MODE): vol.In(list(SERVICE_MODES)),
+        vol.Optional(ATTR_TEMPERATURE): vol.Coerce(float),
+    }
+)
 
-class UWG4(object):
 
-    REGMODE_AUTO = 1
-    REGMODE_COMFORT = 2
-    REGMODE_MANUAL = 3
-    REGMODE_VACATION = 4
+def valid_vacation(data):
+    """Reject a vacation that ends before it starts or in the past."""
+    now = dt_util.now()
+    end = dt_util.as_local(data[ATTR_END])
+    start = dt_util.as_local(data.get(ATTR_START, now))
+    if end <= max(start, now):
+        raise vol.Invalid("end must be after start and in the future")
+    return data
+
+
+SET_VACATION_SCHEMA = vol.All(vol.Schema(
+    {
+        vol.Optional(ATTR_GROUP): cv.string,
+        vol.Required(ATTR_TEMPERATURE): vol.Coerce(float),
+        vol.Optional(ATTR_START): cv.datetime,
+        vol.Required(ATTR_END): cv.datetime,
+    }
+), valid_vacation)
+
+CANCEL_VACATION_SCHEMA = vol.Schema({vol.Optional(ATTR_GROUP): cv.string})
+# Folded stacks written by the profile service, in the config folder.
+PROFILE_FILE = "uwg4_profile.folded"
+
+ACCOUNT_SCHEMA = vol.Schema(
+    {
+        vol.Required(CONF_USERNAME): cv.string,
+        vol.Required(CONF_PASSWORD): cv.string,
+    }
+)
 
-    REGMODETXT = [
-        "ERROR",
-        "AUTO",
-        "COMFORT",
-        "MANUAL",
-        "VACATION",
-    ]
 
-    def __init__(self):
-        self.sessionId = "Not_a_real_sessionId--"
-        self.stateJson = None
-        self.list_of_thermos = []
-        self.last_update = None
-        self.update_budget = 1
-
-        account = self
-        account.login()
-        account.getData()  # actual data gathering
-        pass
-
-    def log(self, msg):
-        # print(msg)
-        pass
-
-    def logerr(self, msg):
-        print(msg)
-
-    def login(self, user=USER, psw=PASSWORD):
-        path = "/api/authenticate/user"
-
-        data = {
-            "Application": 2,
-            "Confirm": "",
-            "Email": user,
-            "Password": psw,
+def unique_accounts(config):
+    """Reject accounts listed twice, they would share their entities."""
+    users = [a[CONF_USERNAME] for a in config.get(CONF_ACCOUNTS, ())]
+    if len(set(users)) != len(users):
+        raise vol.Invalid("each account must have a different username")
+    return config
+
+
+PLATFORM_SCHEMA = vol.All(PLATFORM_SCHEMA.extend(
+    {
+        vol.Inclusive(CONF_USERNAME, "credentials"): cv.string,
+        vol.Inclusive(CONF_PASSWORD, "credentials"): cv.string,
+        vol.Optional(CONF_ACCOUNTS): vol.All(
+            cv.ensure_list, vol.Length(min=1), [ACCOUNT_SCHEMA]
+        ),
+        vol.Optional(CONF_SCAN_INTERVAL, default=SCAN_INTERVAL): cv.time_period,
+        vol.Optional(
+            CONF_RATE_LIMIT, default=RATE_LIMIT_PER_MIN
+        ): vol.All(vol.Coerce(int), vol.Range(min=1)),
+        vol.Optional(
+            CONF_RATE_BURST, default=RATE_BURST
+        ): vol.All(vol.Coerce(int), vol.Range(min=1)),
+        vol.Optional(CONF_TIMEOUT, default=REQUEST_TIMEOUT): cv.positive_int,
+        vol.Optional(
+            CONF_READ_BUDGET, default=READ_BUDGET_SEC
+        ): cv.positive_float,
+        vol.Optional(CONF_ENERGY, default=False): cv.boolean,
+        vol.Optional(CONF_PROFILE, default=False): cv.boolean,
+        vol.Optional(CONF_SNAPSHOT_DIR): cv.string,
+        vol.Optional(CONF_SNAPSHOT_COUNT, default=SNAPSHOT_KEEP): cv.positive_int,
+    }
+), cv.has_at_least_one_key(CONF_USERNAME, CONF_ACCOUNTS), unique_accounts)
+
+
+async def async_setup_platform(
+    hass, config, async_add_entities, discovery_info=None
+):
+    """Set up the sensor platform."""
+    accounts = config.get(CONF_ACCOUNTS) or [
+        {
+            CONF_USERNAME: config[CONF_USERNAME],
+            CONF_PASSWORD: config[CONF_PASSWORD],
         }
-        r = requests.post(HOST + path, json=data)
-        if r.ok:
-            res = r.json()
-            if res["ErrorCode"] == 0:
-                self.log(f"Logged in with username {user}")
-                self.sessionId = res["SessionId"]
-                print(f"Session ID: {self.sessionId}")
-            else:
-                self.logerr(f"Failed to login, error code { res['ErrorCode']}")
-        else:
-            self.logerr("Failed to execute login request")
-
-    def setThermoTemperature(self, thermo_sn, mode, temp):
-
-        path = "/api/thermostat"
-        params = {"sessionid": self.sessionId, "serialnumber": thermo_sn}
-        if mode == self.REGMODE_MANUAL:
-            data = {
-                "RegulationMode": mode,
-                "ManualTemperature": temp,
-            }
-        elif mode == self.REGMODE_COMFORT:
-            td = datetime.timedelta(minutes=COMFORT_TIME)
-            d = datetime.datetime.utcnow()
-            e = d + td
-            comfort_end = e.strftime("%d/%m/%Y %H:%M:00 +00:00")
-            data = {
-                "RegulationMode": mode,
-                "ComfortTemperature": temp,
-                "ComfortEndTime": comfort_end,
-            }
-        elif mode == self.REGMODE_VACATION:
-            # For now, vacation is not implemented.
-            is_vacation = False
-            vacation_begin = "01/01/1970 00:00:00"
-            vacation_end = "01/01/1970 00:00:00"
-            data = {
-                "RegulationMode": mode,
-                "VacationEnabled": is_vacation,
-                "VacationTemperature": temp,
-                "VacationBeginDay": vacation_begin,
-                "VacationEndDay": vacation_end,
-            }
-        else:
-            # For everything else (including AUTO), just set AUTO.
-            data = {
-                "RegulationMode": self.REGMODE_AUTO,
-            }
-
-        r = requests.post(HOST + path, json=data, params=params)
-        res = r.json()
-        if res["Success"] != True:
-            self.login()
-            r = requests.post(HOST + path, json=data, params=params)
-            res = r.json()
-            if res["Success"] != True:
-                self.logerr("Operation failed")
-        self.allow_next_update()
-
-    def update_allowed(self):
-        now = time.time()
-        if (self.last_update == None) or (
-            int(now - self.last_update) > UPDATE_RATE_SEC
-        ):
-            dt = datetime.datetime.now()
-            dt = dt.strftime("%Y-%m-%d %H:%M:%S")
-            self.logerr(f"{dt} - Update allowed")
-            self.last_update = now
-            return True
-        return False
-
-    def allow_next_update(self):
-        self.update_budget = self.update_budget + 1
-
-    def getData(self, force=False):
-        if self.update_budget > 0:
-            self.update_budget = self.update_budget - 1
-        elif not self.update_allowed():
-            return
-
-        path = "/api/thermostats"
-        data = {"sessionid": self.sessionId}
-
-        r = requests.get(HOST + path, params=data)
-        if not r.ok:
-            self.login()
-            r = requests.get(HOST + path, params=data)
-            if not r.ok:
-                self.logerr("Failed to execute request ")
-                return
-        res = r.json()
-
-        if "Groups" in res:
-            found = 0
-            for group in res["Groups"]:
-                if "Thermostats" in group:
-                    found = found + 1
-            if found == 0:
-                self.logerr("Failed to retrieve any thermostats")
-                return
-        else:
-            self.logerr("Failed to get group information")
-            return
-
-        self.stateJson = res
-        with open("data.json", "w") as outfile:
-            json.dump(res, outfile)
-
-    def getThermoInfo(self, data=None):
-        if data == None:
-            data = self.stateJson
-        for group in data["Groups"]:
-            gname = group["GroupName"]
-
-            for thermo in group["Thermostats"]:
-                regmode = int(thermo["RegulationMode"])
-                actualTemp = thermo["Temperature"]
-                actualTemp = actualTemp / 100
-                if regmode == self.REGMODE_AUTO:
-                    setpointTemp = thermo["SetPointTemp"]
-                elif regmode == self.REGMODE_COMFORT:
-                    setpointTemp = thermo["ComfortTemperature"]
-                elif regmode == self.REGMODE_MANUAL:
-                    setpointTemp = thermo["ManualTemperature"]
-                elif regmode == self.REGMODE_VACATION:
-                    setpointTemp = thermo["VacationTemperature"]
-
-                setpointTemp = setpointTemp / 100
-                heatingOn = thermo["Heating"]
-                name = thermo["Room"]
-                online = thermo["Online"]
-                sn = thermo["SerialNumber"]
-
-                therm = None
-                for e in self.list_of_thermos:
-                    if e.name == name:
-                        therm = e
-                if not therm:
-                    therm = UWG4_Hvac()
-                    # print(f"Adding {name}")
-                    self.list_of_thermos.append(therm)
-                therm.set_props(
-                    name,
-                    actualTemp,
-                    setpointTemp,
-                    heatingOn,
-                    regmode,
-                    online,
-                    sn,
-                    self,
-                )
-
-        return self.list_of_thermos
-
-
-#############################################################################
-from abc import abstractmethod
-from datetime import timedelta
-import functools as ft
-import logging
-from typing import Any, Dict, List, Optional
-from homeassistant.util.unit_conversion import TemperatureConverter 
+    ]
+    hub = UWG4Hub(
+        timeout=config[CONF_TIMEOUT],
+        interval=config[CONF_SCAN_INTERVAL].total_seconds(),
+        rate_limit=config[CONF_RATE_LIMIT],
+        rate_burst=config[CONF_RATE_BURST],
+        read_budget=config[CONF_READ_BUDGET],
+    )
+
+    async def async_close(event):
+        await hub.close()
+
+    hass.bus.async_listen_once(EVENT_HOMEASSISTANT_STOP, async_close)
+
+    def add_entities_on_change(t):
+        entities = {}  # serial number -> UWG4_Hvac
+
+        @callback
+        def async_registry_changed(added, removed):
+            new = []
+            for thermo in added:
+                new.append(UWG4_Hvac(t, thermo))
+                entities[thermo.serial] = new[-1]
+            if new:
+                async_add_entities(new)
+            for thermo in removed:
+                entity = entities.pop(thermo.serial)
+                hass.async_create_task(entity.async_remove())
+
+        t.add_registry_listener(async_registry_changed)
+
+    def save_state_on_change(t, store):
+        def save_state():
+            store.async_delay_save(t.snapshot, STATE_SAVE_DELAY)
+
+        t.add_listener(save_state)
+
+    for account in accounts:
+        user = account[CONF_USERNAME]
+        recorder = None
+        if CONF_SNAPSHOT_DIR in config:
+            recorder = SnapshotRecorder(
+                hass.config.path(config[CONF_SNAPSHOT_DIR], slugify(user)),
+                config[CONF_SNAPSHOT_COUNT],
+            )
+        t = hub.add_account(
+            user,
+            account[CONF_PASSWORD],
+            recorder=recorder,
+            store=Store(hass, 1, f"{DOMAIN}.session.{slugify(user)}"),
+        )
+        add_entities_on_change(t)
+        # Entities are created from the last known state right away,
+        # the cloud is contacted in the background.
+        state_store = Store(hass, 1, f"{DOMAIN}.state.{slugify(user)}")
+        t.restore(await state_store.async_load())
+        save_state_on_change(t, state_store)
+
+    hass.data[DOMAIN] = {"hub": hub}
+
+    async def async_load_sensors(hass, component):
+        # Loading the platform sets up the sensor integration if it is
+        # not yet, with the config given here. Waiting for it (or for
+        # the start, if it is not configured) keeps the user's sensors.
+        await async_load_platform(
+            hass, Platform.SENSOR, DOMAIN,
+            {CONF_ENERGY: config[CONF_ENERGY]}, {},
+        )
 
-from homeassistant.const import UnitOfTemperature
+    async_when_setup_or_start(hass, Platform.SENSOR, async_load_sensors)
+
+    async def async_diagnostics(call):
+        return {"accounts": hub.diagnostics()}
+
+    hass.services.async_register(
+        DOMAIN, SERVICE_DIAGNOSTICS, async_diagnostics,
+        supports_response=SupportsResponse.ONLY,
+    )
+
+    async def async_set_group(call):
+        mode = SERVICE_MODES[call.data[CONF_MODE]]
+        temp = call.data.get(ATTR_TEMPERATURE)
+        if temp is None and mode != REGMODE_AUTO:
+            raise HomeAssistantError("temperature is required for this mode")
+        results = await hub.setGroupTemperature(
+            call.data.get(ATTR_GROUP),
+            mode,
+            None if temp is None else int(temp * 100),
+        )
+        return {"results": {str(sn): ok for sn, ok in results.items()}}
+
+    hass.services.async_register(
+        DOMAIN, SERVICE_SET_GROUP, async_set_group, schema=SET_GROUP_SCHEMA,
+        supports_response=SupportsResponse.OPTIONAL,
+    )
+
+    async def async_set_vacation(call):
+        start = call.data.get(ATTR_START)
+        if start is not None:
+            start = dt_util.as_local(start).replace(tzinfo=None)
+        results = await hub.setVacation(
+            call.data.get(ATTR_GROUP),
+            int(call.data[ATTR_TEMPERATURE] * 100),
+            start,
+            dt_util.as_local(call.data[ATTR_END]).replace(tzinfo=None),
+        )
+        return {"results": {str(sn): ok for sn, ok in results.items()}}
 
-from homeassistant.components.climate import (
-    ClimateEntity,
-    ClimateEntityFeature,
-    HVACAction,
-    HVACMode,
-)
+    hass.services.async_register(
+        DOMAIN, SERVICE_SET_VACATION, async_set_vacation,
+        schema=SET_VACATION_SCHEMA,
+        supports_response=SupportsResponse.OPTIONAL,
+    )
 
+    async def async_cancel_vacation(call):
+        results = await hub.cancelVacation(call.data.get(ATTR_GROUP))
+        return {"results": {str(sn): ok for sn, ok in results.items()}}
 
-DEFAULT_MAX_TEMP = 25.0
-DEFAULT_MIN_TEMP = 5.0
+    hass.services.async_register(
+        DOMAIN, SERVICE_CANCEL_VACATION, async_cancel_vacation,
+        schema=CANCEL_VACATION_SCHEMA,
+        supports_response=SupportsResponse.OPTIONAL,
+    )
+    if config[CONF_PROFILE]:
+        setup_profile(hass)
 
+    async def async_connect():
+        await hub.connect()
+        # One shared poll per account; entities are pushed to.
+        hub.start()
 
-def setup_platform(hass, config, add_entities, discovery_info=None):
-    """Set up the sensor platform."""
-    t = UWG4()
-    thermos = t.getThermoInfo()
-    add_entities(thermos)
+    hass.async_create_background_task(async_connect(), f"{DOMAIN} connect")
+
+
+def setup_profile(hass):
+    """Record span timings and register the service dumping them."""
+    sampler = SpanSampler()
+    remove_hook = TRACER.add_hook(sampler)
+
+    @callback
+    def async_stop(event):
+        remove_hook()
+
+    hass.bus.async_listen_once(EVENT_HOMEASSISTANT_STOP, async_stop)
+
+    async def async_profile(call):
+        path = hass.config.path(PROFILE_FILE)
+        # Spans are added on the event loop, so they are read here and
+        # only the file is written in the executor.
+        text = sampler.folded()
+
+        def write():
+            with open(path, "w") as outfile:
+                outfile.write(text)
+
+        await hass.async_add_executor_job(write)
+        return {"file": path, "phases": sampler.phases()}
+
+    hass.services.async_register(
+        DOMAIN, SERVICE_PROFILE, async_profile,
+        supports_response=SupportsResponse.ONLY,
+    )
 
 
 class UWG4_Hvac(ClimateEntity):
@@ -251,28 +336,43 @@ class UWG4_Hvac(ClimateEntity):
     PRESETMODE_MANUAL = "Permanent Hold"
     PRESETMODE_VACATION = "Vacation Hold"
 
-    def set_props(
-            self, name, temp_act, temp_setpoint, heatingOn, regmode,
-            online, sn, parent
-    ):
-        self._name = name
-        self._temp_act = temp_act
-        self._temp_setpoint = temp_setpoint
-        self._isOnline = online
-        self._isHeating = heatingOn
-        self._regmode = regmode
+    _attr_should_poll = False
+    # Static attributes, computed once instead of on every state write.
+    _attr_supported_features = (
+        ClimateEntityFeature.TARGET_TEMPERATURE | ClimateEntityFeature.PRESET_MODE
+    )
+    _attr_temperature_unit = UnitOfTemperature.CELSIUS
+    _attr_hvac_modes = [HVACMode.HEAT, HVACMode.AUTO]
+    _attr_preset_modes = [
+        PRESETMODE_AUTO,
+        PRESETMODE_COMFORT,
+        PRESETMODE_MANUAL,
+        PRESETMODE_VACATION,
+    ]
+    _attr_min_temp = DEFAULT_MIN_TEMP
+    _attr_max_temp = DEFAULT_MAX_TEMP
+
+    def __init__(self, parent, thermo):
         self._parent = parent
-        self._thermoSN = sn
+        self._thermoSN = thermo.serial
+        self._thermo = thermo
 
-    @property
-    def supported_features(self) -> int:
-        """Return the list of supported features."""
-        return ClimateEntityFeature.TARGET_TEMPERATURE | ClimateEntityFeature.PRESET_MODE
+    async def async_added_to_hass(self) -> None:
+        """Subscribe to the account refresh."""
+        self.async_on_remove(
+            self._parent.add_listener(self._async_thermo_changed, self._thermoSN)
+        )
+
+    @callback
+    def _async_thermo_changed(self):
+        self._thermo = self._parent.thermostats.get(self._thermoSN, self._thermo)
+        with TRACER.span("write_state"):
+            self.async_write_ha_state()
 
     @property
     def name(self):
         """Return the name of the sensor."""
-        return self._name
+        return self._thermo.name
 
     @property
     def unique_id(self):
@@ -280,9 +380,15 @@ class UWG4_Hvac(ClimateEntity):
         return self._thermoSN
 
     @property
-    def temperature_unit(self) -> str:
-        """Return the unit of measurement used by the platform."""
-        return UnitOfTemperature.CELSIUS
+    def extra_state_attributes(self):
+        """Return whether the data is out of date (not polled for a
+        few poll intervals) and the error of the last rejected change,
+        if any."""
+        attributes = {"stale": self._parent.is_stale(self._thermoSN)}
+        error = self._parent.write_errors.get(self._thermoSN)
+        if error is not None:
+            attributes["write_error"] = error
+        return attributes
 
     @property
     def hvac_mode(self) -> str:
@@ -292,20 +398,13 @@ class UWG4_Hvac(ClimateEntity):
         HVACMode.HEAT	The device is set to heat to a target temperature.
         HVACMode.AUTO	The device is set to a schedule, learned behavior, AI.
         """
-        if not self._isOnline:
+        if not self._thermo.online:
             return HVACMode.OFF
-        if self._regmode == UWG4.REGMODE_AUTO:
+        if self._thermo.regmode == UWG4.REGMODE_AUTO:
             return HVACMode.AUTO
         else:
             return HVACMode.HEAT
 
-    @property
-    def hvac_modes(self) -> List[str]:
-        """Return the list of available hvac operation modes.
-        Need to be a subset of HVACMode.*
-        """
-        return [HVACMode.HEAT, HVACMode.AUTO]
-
     @property
     def hvac_action(self) -> Optional[str]:
         """Return the current running hvac operation if supported.
@@ -314,9 +413,9 @@ class UWG4_Hvac(ClimateEntity):
         HVACAction.HEATING	Device is heating.
         HVACAction.IDLE		Device is idle.
         """
-        if not self._isOnline:
+        if not self._thermo.online:
             return HVACAction.OFF
-        if self._isHeating:
+        if self._thermo.heating:
             return HVACAction.HEATING
         else:
             return HVACAction.IDLE
@@ -324,31 +423,30 @@ class UWG4_Hvac(ClimateEntity):
     @property
     def current_temperature(self) -> Optional[float]:
         """Return the current temperature."""
-        return self._temp_act
+        return self._thermo.temperature
 
     @property
     def target_temperature(self) -> Optional[float]:
         """Return the temperature we try to reach."""
-        return self._temp_setpoint
+        return self._thermo.setpoint
 
-    def set_temperature(self, **kwargs) -> None:
+    async def async_set_temperature(self, **kwargs) -> None:
         """Set new target temperature."""
         # for key, value in kwargs.items():
         #     print("{0} = {1}".format(key, value))
         temp = float(kwargs["temperature"])
-        if self._regmode == UWG4.REGMODE_AUTO:
+        if self._thermo.regmode == UWG4.REGMODE_AUTO:
             regmode = UWG4.REGMODE_COMFORT
         else:
-            regmode = self._regmode
-        self._parent.setThermoTemperature(
+            regmode = self._thermo.regmode
+        self._parent.queueThermoTemperature(
             self._thermoSN,
             regmode,
             int(temp * 100),
         )
-        self._temp_setpoint = temp
         # print(f"Setting temperature: {int(temp * 100)}")
 
-    def set_hvac_mode(self, hvac_mode: str) -> None:
+    async def async_set_hvac_mode(self, hvac_mode: str) -> None:
         """Set new target hvac mode."""
         # No function to turn OFF/ON/IDLE
 
@@ -358,30 +456,15 @@ class UWG4_Hvac(ClimateEntity):
         Requires SUPPORT_PRESET_MODE.
         """
         preset = self.PRESETMODE_AUTO
-        if self._regmode == UWG4.REGMODE_COMFORT:
+        if self._thermo.regmode == UWG4.REGMODE_COMFORT:
             preset = self.PRESETMODE_COMFORT
-        elif self._regmode == UWG4.REGMODE_MANUAL:
+        elif self._thermo.regmode == UWG4.REGMODE_MANUAL:
             preset = self.PRESETMODE_MANUAL
-        elif self._regmode == UWG4.REGMODE_VACATION:
+        elif self._thermo.regmode == UWG4.REGMODE_VACATION:
             preset = self.PRESETMODE_VACATION
         return preset
 
-    @property
-    def preset_modes(self) -> Optional[List[str]]:
-        """Return a list of available preset modes.
-        Requires SUPPORT_PRESET_MODE.
-        """
-        # this does not match the parent class because it can arrive
-        # as input from the user
-        PRESET_MODES = [
-            self.PRESETMODE_AUTO,
-            self.PRESETMODE_COMFORT,
-            self.PRESETMODE_MANUAL,
-            # self.PRESETMODE_VACATION,
-        ]
-        return PRESET_MODES
-
-    def set_preset_mode(self, preset_mode: str) -> None:
+    async def async_set_preset_mode(self, preset_mode: str) -> None:
         """Set new preset mode."""
         # self.preset_mode = preset_mode
         regmode = UWG4.REGMODE_AUTO
@@ -393,30 +476,17 @@ class UWG4_Hvac(ClimateEntity):
             regmode = UWG4.REGMODE_MANUAL
         if preset_mode == self.PRESETMODE_VACATION:
             regmode = UWG4.REGMODE_VACATION
-        self._parent.setThermoTemperature(
+        self._parent.queueThermoTemperature(
             self._thermoSN,
             regmode,
-            int(self._temp_setpoint * 100),
-        )
-        self._regmode = regmode
-
-    @property
-    def min_temp(self) -> float:
-        """Return the minimum temperature."""
-        return TemperatureConverter.convert(
-            DEFAULT_MIN_TEMP, UnitOfTemperature.CELSIUS, self.temperature_unit
-        )
-
-    @property
-    def max_temp(self) -> float:
-        """Return the maximum temperature."""
-        return TemperatureConverter.convert(
-            DEFAULT_MAX_TEMP, UnitOfTemperature.CELSIUS, self.temperature_unit
+            int(self._thermo.setpoint * 100),
         )
 
-    def update(self):
+    async def async_update(self):
         """Fetch new state data for the sensor.
-        This is the only method that should fetch new data for Home Assistant.
+        Regular polling is done once per account by UWG4.refresh(), this is
+        only used when an update is explicitly requested. It waits at most
+        read_budget seconds, a slower refresh updates the entity when done.
         """
-        self._parent.getData()
-        self._parent.getThermoInfo()
+        with TRACER.span("update"):
+            await self._parent.read()
@@ -1,3 +1,12 @@
 """Constants for the My Integration integration."""
 
 DOMAIN = "uwg4"
+
+CONF_SNAPSHOT_DIR = "snapshot_dir"
+CONF_SNAPSHOT_COUNT = "snapshot_count"
+CONF_RATE_LIMIT = "rate_limit"
+CONF_RATE_BURST = "rate_burst"
+CONF_ACCOUNTS = "accounts"
+CONF_ENERGY = "energy"
+CONF_PROFILE = "profile"
+CONF_READ_BUDGET = "read_budget"
@@ -0,0 +1,150 @@
+"""Incremental download of thermostat energy use into a local store."""
+import asyncio
+import datetime
+import sqlite3
+import threading
+
+from .flight import SingleFlight
+
+ENERGY_PATH = "/api/energyusage"
+DATE_FORMAT = "%d/%m/%Y %H:%M:%S"
+
+# History fetched for a thermostat that has nothing stored yet.
+HISTORY_DAYS = 31
+# Energy is stored per hour, only complete hours are downloaded.
+PERIOD_SEC = 60 * 60
+# Thermostats downloaded at the same time.
+SYNC_LIMIT = 2
+
+
+def decode_energy(res):
+    """Turn an energy response into a list of (timestamp, kWh)."""
+    rows = []
+    for entry in res["EnergyUsage"]:
+        stamp = datetime.datetime.strptime(entry["Date"], DATE_FORMAT)
+        stamp = stamp.replace(tzinfo=datetime.timezone.utc)
+        rows.append((int(stamp.timestamp()), float(entry["kWh"])))
+    return rows
+
+
+class EnergyStore(object):
+    """Hourly energy use per thermostat, in an SQLite file.
+
+    Rows are clustered by (serial, start) so the range queries used by
+    sensors stay fast over months of data. Methods block, call them
+    from an executor.
+    """
+
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._db:
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS energy ("
+                " serial TEXT NOT NULL,"
+                " start INTEGER NOT NULL,"
+                " kwh REAL NOT NULL,"
+                " PRIMARY KEY (serial, start)"
+                ") WITHOUT ROWID"
+            )
+
+    def last(self, serial):
+        """Return the start of the newest stored hour, None if empty."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT MAX(start) FROM energy WHERE serial = ?", (str(serial),)
+            ).fetchone()
+        return row[0]
+
+    def add(self, serial, rows):
+        """Store (timestamp, kWh) rows, replacing hours already stored."""
+        with self._lock, self._db:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO energy VALUES (?, ?, ?)",
+                [(str(serial), start, kwh) for start, kwh in rows],
+            )
+
+    def totals(self):
+        """Return {serial: total kWh} of everything stored."""
+        with self._lock:
+            return dict(self._db.execute(
+                "SELECT serial, SUM(kwh) FROM energy GROUP BY serial"
+            ))
+
+    def series(self, serial, start, end):
+        """Return the (timestamp, kWh) rows of serial in [start, end)."""
+        with self._lock:
+            return self._db.execute(
+                "SELECT start, kwh FROM energy"
+                " WHERE serial = ? AND start >= ? AND start < ?"
+                " ORDER BY start",
+                (str(serial), start, end),
+            ).fetchall()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class EnergyHistory(object):
+    """Keep the store of an account up to date.
+
+    Each sync only asks the server for the hours after the newest one
+    already stored, so restarts never download history again.
+    """
+
+    def __init__(self, client, store):
+        self.client = client
+        self.store = store
+        self.totals = {}  # serial number -> kWh
+        self._listeners = []
+        # Syncs started while one runs share it, so the same hours are
+        # not downloaded twice.
+        self._sync = SingleFlight(self._do_sync)
+
+    def add_listener(self, callback):
+        """Subscribe callback to be called after every sync."""
+        self._listeners.append(callback)
+
+        def remove_listener():
+            self._listeners.remove(callback)
+
+        return remove_listener
+
+    async def sync(self, now=None):
+        """Download the new complete hours of all thermostats."""
+        await self._sync()
+
+    async def _do_sync(self):
+        loop = asyncio.get_running_loop()
+        limit = asyncio.Semaphore(SYNC_LIMIT)
+        end = int(datetime.datetime.now(datetime.timezone.utc).timestamp())
+        end -= end % PERIOD_SEC
+
+        async def sync_one(serial):
+            async with limit:
+                last = await loop.run_in_executor(None, self.store.last, serial)
+                if last is None:
+                    start = end - HISTORY_DAYS * 24 * PERIOD_SEC
+                else:
+                    start = last + PERIOD_SEC
+                if start >= end:
+                    return
+                rows = await self.client.getEnergy(
+                    serial, _utc(start), _utc(end)
+                )
+                if rows:
+                    await loop.run_in_executor(
+                        None, self.store.add, serial, rows
+                    )
+
+        await asyncio.gather(
+            *(sync_one(sn) for sn in list(self.client.thermostats))
+        )
+        self.totals = await loop.run_in_executor(None, self.store.totals)
+        for callback in list(self._listeners):
+            callback()
+
+
+def _utc(stamp):
+    return datetime.datetime.fromtimestamp(stamp, datetime.timezone.utc)
@@ -0,0 +1,37 @@
+"""Sharing of one in-flight call among concurrent callers."""
+import asyncio
+
+
+class SingleFlight(object):
+    """Run func (a coroutine function) once for all concurrent callers.
+
+    A call made while another is in flight waits for that one and gets
+    its result, instead of starting a second request. Cancelling a
+    caller does not cancel the shared call.
+    """
+
+    def __init__(self, func):
+        self._func = func
+        self._task = None
+        self.joined = 0  # calls served by a call already in flight
+
+    @property
+    def in_flight(self):
+        return self._task is not None
+
+    def start(self):
+        """Start the call unless one is in flight, returns its task."""
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        else:
+            self.joined += 1
+        return self._task
+
+    async def _run(self):
+        try:
+            return await self._func()
+        finally:
+            self._task = None
+
+    async def __call__(self):
+        return await asyncio.shield(self.start())
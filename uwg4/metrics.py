@@ -0,0 +1,123 @@
+"""Performance counters of the UWG4 client."""
+import time
+
+# Upper bounds (milliseconds) of the latency histogram buckets, the last
+# bucket takes everything slower.
+LATENCY_BOUNDS_MS = (50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+class Histogram(object):
+    """Count of values per bucket, with their sum and maximum."""
+
+    def __init__(self, bounds=LATENCY_BOUNDS_MS):
+        self.bounds = bounds
+        self.buckets = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, value):
+        i = 0
+        while i < len(self.bounds) and value > self.bounds[i]:
+            i += 1
+        self.buckets[i] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    @property
+    def mean(self):
+        if not self.count:
+            return None
+        return self.total / self.count
+
+    def quantile(self, q):
+        """Return the upper bound of the bucket holding quantile q, at
+        most the maximum, None if empty."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.buckets):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def as_dict(self):
+        return {
+            "count": self.count,
+            "mean": _round(self.mean),
+            "p95": _round(self.quantile(0.95)),
+            "max": _round(self.max),
+            "buckets": dict(zip(
+                [f"le_{b}" for b in self.bounds] + ["inf"], self.buckets
+            )),
+        }
+
+
+class Metrics(object):
+    """Counters of one account: requests per endpoint, polls and data
+    freshness. Durations are in milliseconds."""
+
+    def __init__(self):
+        self.latency = {}  # endpoint path -> Histogram
+        self.poll = Histogram()
+        self.requests = 0
+        self.errors = 0  # failed requests, or status >= 400
+        self.retries = 0  # requests sent again, after a failure or login
+        self.rejected = 0  # requests refused by the circuit breaker
+        self.stale_reads = 0  # reads answered before their refresh ended
+        self.bytes = 0
+        self.last_size = None  # bytes of the last response
+        self.last_poll_ms = None
+        self.last_success = None  # time.time() of the last good poll
+
+    def request(self, path, elapsed_ms, status, size):
+        """Count a request, status and size are None if it failed."""
+        self.requests += 1
+        histogram = self.latency.get(path)
+        if histogram is None:
+            histogram = self.latency[path] = Histogram()
+        histogram.add(elapsed_ms)
+        if status is None or status >= 400:
+            self.errors += 1
+        if size is not None:
+            self.bytes += size
+            self.last_size = size
+
+    def polled(self, elapsed_ms, ok):
+        """Count a poll of the account."""
+        self.poll.add(elapsed_ms)
+        self.last_poll_ms = elapsed_ms
+        if ok:
+            self.last_success = time.time()
+
+    def data_age(self, now=None):
+        """Seconds since the last good poll, None before the first."""
+        if self.last_success is None:
+            return None
+        if now is None:
+            now = time.time()
+        return now - self.last_success
+
+    def as_dict(self):
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "retries": self.retries,
+            "rejected": self.rejected,
+            "stale_reads": self.stale_reads,
+            "bytes": self.bytes,
+            "last_response_bytes": self.last_size,
+            "last_poll_ms": _round(self.last_poll_ms),
+            "data_age_s": _round(self.data_age()),
+            "poll_ms": self.poll.as_dict(),
+            "latency_ms": {
+                path: h.as_dict() for path, h in self.latency.items()
+            },
+        }
+
+
+def _round(value):
+    return None if value is None else round(value, 1)
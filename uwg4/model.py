@@ -0,0 +1,122 @@
+"""Compact thermostat records decoded from the cloud responses."""
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+REGMODE_AUTO = 1
+REGMODE_COMFORT = 2
+REGMODE_MANUAL = 3
+REGMODE_VACATION = 4
+
+# Field holding the active setpoint, per regulation mode.
+SETPOINT_FIELD = {
+    REGMODE_AUTO: "SetPointTemp",
+    REGMODE_COMFORT: "ComfortTemperature",
+    REGMODE_MANUAL: "ManualTemperature",
+    REGMODE_VACATION: "VacationTemperature",
+}
+
+
+def loads(body):
+    """Decode a JSON response, with orjson when it is installed."""
+    if orjson is not None:
+        return orjson.loads(body)
+    return json.loads(body)
+
+
+class Thermostat(object):
+    """State of one thermostat, only the fields in use.
+
+    Temperatures are in degrees Celsius. Records are not modified once
+    created, a change produces a new record.
+    """
+
+    __slots__ = (
+        "serial",
+        "name",
+        "temperature",
+        "setpoint",
+        "heating",
+        "regmode",
+        "online",
+        "group",
+    )
+
+    def __init__(
+            self, serial, name, temperature, setpoint, heating, regmode,
+            online, group
+    ):
+        self.serial = serial
+        self.name = name
+        self.temperature = temperature
+        self.setpoint = setpoint
+        self.heating = heating
+        self.regmode = regmode
+        self.online = online
+        self.group = group
+
+    @classmethod
+    def from_json(cls, thermo, group):
+        """Build a record from one thermostat of a server response."""
+        regmode = int(thermo["RegulationMode"])
+        setpoint = thermo[SETPOINT_FIELD.get(regmode, "SetPointTemp")]
+        return cls(
+            thermo["SerialNumber"],
+            thermo["Room"],
+            thermo["Temperature"] / 100,
+            setpoint / 100,
+            thermo["Heating"],
+            regmode,
+            thermo["Online"],
+            group,
+        )
+
+    def to_list(self):
+        """Return the fields as a list, Thermostat(*list) rebuilds it."""
+        return [
+            self.serial,
+            self.name,
+            self.temperature,
+            self.setpoint,
+            self.heating,
+            self.regmode,
+            self.online,
+            self.group,
+        ]
+
+    def to_dict(self):
+        """Return the fields as a dict, for JSON output."""
+        return dict(zip(self.__slots__, self.to_list()))
+
+    def key(self):
+        """Tuple of all fields, equal for records with the same state."""
+        return (
+            self.serial,
+            self.name,
+            self.temperature,
+            self.setpoint,
+            self.heating,
+            self.regmode,
+            self.online,
+            self.group,
+        )
+
+    def with_setting(self, regmode, setpoint):
+        """Return a copy with another regulation mode and setpoint."""
+        return Thermostat(
+            self.serial, self.name, self.temperature, setpoint, self.heating,
+            regmode, self.online, self.group,
+        )
+
+
+def decode_thermostats(res):
+    """Turn a /api/thermostats response into Thermostat records in one
+    pass. The raw response can be dropped afterwards."""
+    return [
+        Thermostat.from_json(thermo, group["GroupName"])
+        for group in res["Groups"]
+        for thermo in group.get("Thermostats", ())
+    ]
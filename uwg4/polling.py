@@ -0,0 +1,88 @@
+"""Poll scheduling and request rate limiting for the UWG4 cloud."""
+import asyncio
+import time
+
+# Polling pace, in seconds. After a write or a heating on/off change the
+# account is polled every FAST_INTERVAL_SEC for FAST_WINDOW_SEC. When no
+# thermostat is heating the interval doubles after IDLE_POLLS polls, up
+# to MAX_INTERVAL_SEC.
+POLL_INTERVAL_SEC = 60
+FAST_INTERVAL_SEC = 15
+FAST_WINDOW_SEC = 3 * 60
+MAX_INTERVAL_SEC = 10 * 60
+IDLE_POLLS = 3
+
+# Hard ceiling on requests sent to the server (all endpoints), so the
+# account does not get blacklisted.
+RATE_LIMIT_PER_MIN = 6
+RATE_BURST = 6
+
+
+class TokenBucket(object):
+    """Allow rate requests per second on average, capacity at once."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._stamp = time.monotonic()
+
+    def _fill(self):
+        now = time.monotonic()
+        self._tokens = min(
+            self.capacity, self._tokens + (now - self._stamp) * self.rate
+        )
+        self._stamp = now
+
+    @property
+    def tokens(self):
+        """Requests that can be sent right now."""
+        self._fill()
+        return self._tokens
+
+    def try_acquire(self):
+        """Take a token if one is available."""
+        self._fill()
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return True
+        return False
+
+    async def acquire(self):
+        """Wait until a token is available and take it."""
+        while not self.try_acquire():
+            await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class PollScheduler(object):
+    """Choose the delay until the next poll of an account."""
+
+    def __init__(
+            self, interval=POLL_INTERVAL_SEC, fast_interval=FAST_INTERVAL_SEC,
+            max_interval=MAX_INTERVAL_SEC, fast_window=FAST_WINDOW_SEC
+    ):
+        self.interval = interval
+        self.fast_interval = min(fast_interval, interval)
+        self.max_interval = max(max_interval, interval)
+        self.fast_window = fast_window
+        self._fast_until = 0
+        self._idle = 0  # polls in a row with nothing going on
+
+    def boost(self):
+        """Poll fast for a while, after a write or a heating change."""
+        self._fast_until = time.monotonic() + self.fast_window
+        self._idle = 0
+
+    def polled(self, busy):
+        """Record a poll; busy if any thermostat is heating."""
+        if busy:
+            self._idle = 0
+        else:
+            self._idle += 1
+
+    def next_delay(self):
+        """Seconds until the next poll."""
+        if time.monotonic() < self._fast_until:
+            return self.fast_interval
+        backoff = max(0, self._idle - IDLE_POLLS + 1)
+        return min(self.max_interval, self.interval * 2 ** min(backoff, 16))
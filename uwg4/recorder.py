@@ -0,0 +1,80 @@
+"""Opt-in recorder of raw /api/thermostats snapshots."""
+import gzip
+import hashlib
+import logging
+import os
+import threading
+import time
+
+_LOGGER = logging.getLogger(__name__)
+
+# Number of snapshots kept before the oldest is deleted.
+SNAPSHOT_KEEP = 10
+
+PREFIX = "data-"
+SUFFIX = ".json.gz"
+
+
+class SnapshotRecorder(object):
+    """Write changed payloads to rotating, gzip compressed files.
+
+    Writing happens on a background thread, record() never touches the
+    disk. When payloads arrive faster than they can be written only the
+    newest one is kept.
+    """
+
+    def __init__(self, path, keep=SNAPSHOT_KEEP):
+        self.path = path
+        self.keep = max(1, keep)
+        self._digest = None
+        self._pending = None
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def record(self, payload):
+        """Queue payload (bytes) if it differs from the previous one."""
+        digest = hashlib.sha1(payload).digest()
+        if digest == self._digest:
+            return False
+        self._digest = digest
+        with self._cond:
+            self._pending = payload
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="uwg4-recorder", daemon=True
+                )
+                self._thread.start()
+            self._cond.notify()
+        return True
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._pending is None:
+                    self._cond.wait()
+                payload, self._pending = self._pending, None
+            try:
+                self._write(payload)
+            except OSError as err:
+                _LOGGER.warning("Failed to write snapshot: %s", err)
+
+    def _write(self, payload):
+        os.makedirs(self.path, exist_ok=True)
+        now = time.time()
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(now))
+        name = os.path.join(
+            self.path, f"{PREFIX}{stamp}-{int(now * 1000) % 1000:03d}{SUFFIX}"
+        )
+        tmp = name + ".tmp"
+        with gzip.open(tmp, "wb") as outfile:
+            outfile.write(payload)
+        os.replace(tmp, name)
+        self._rotate()
+
+    def _rotate(self):
+        snapshots = sorted(
+            f for f in os.listdir(self.path)
+            if f.startswith(PREFIX) and f.endswith(SUFFIX)
+        )
+        for f in snapshots[:-self.keep]:
+            os.remove(os.path.join(self.path, f))
@@ -0,0 +1,112 @@
+"""Retries and circuit breaking for requests to the UWG4 cloud."""
+import random
+import time
+
+# Attempts per request when the server fails (no answer or status 5xx),
+# with a random delay between them of up to RETRY_BASE_SEC doubled per
+# attempt, at most RETRY_MAX_SEC.
+RETRY_ATTEMPTS = 3
+RETRY_BASE_SEC = 1
+RETRY_MAX_SEC = 10
+
+# Failures in a row after which requests fail fast, and how long they
+# do before one probe request is let through. The pause doubles every
+# time the probe fails, up to BREAKER_MAX_OPEN_SEC.
+BREAKER_THRESHOLD = 5
+BREAKER_OPEN_SEC = 30
+BREAKER_MAX_OPEN_SEC = 10 * 60
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+def backoff_delay(attempt, base=RETRY_BASE_SEC, cap=RETRY_MAX_SEC):
+    """Return the delay before retry number attempt (from 0), random so
+    that clients failing together do not retry together."""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class CircuitBreaker(object):
+    """Stop sending requests to a server that keeps failing.
+
+    Closed: requests pass. After threshold failures in a row it opens:
+    requests are refused until open_sec (with jitter) has passed. Then
+    it is half open: a single probe request passes, its success closes
+    the breaker, its failure opens it again for twice as long.
+    """
+
+    def __init__(
+            self, threshold=BREAKER_THRESHOLD, open_sec=BREAKER_OPEN_SEC,
+            max_open_sec=BREAKER_MAX_OPEN_SEC
+    ):
+        self.threshold = threshold
+        self.open_sec = open_sec
+        self.max_open_sec = max_open_sec
+        self.state = CLOSED
+        self.failures = 0  # in a row
+        self._pause = open_sec
+        self._open_until = 0
+        self._probing = False
+
+    @property
+    def rejecting(self):
+        """True while requests are refused, does not start a probe."""
+        if self.state == CLOSED:
+            return False
+        if self.state == OPEN:
+            return time.monotonic() < self._open_until
+        return self._probing
+
+    @property
+    def retry_in(self):
+        """Seconds until the next probe is allowed, 0 if not open."""
+        if self.state != OPEN:
+            return 0
+        return max(0.0, self._open_until - time.monotonic())
+
+    def allow(self):
+        """Return True if a request may be sent now. In the half open
+        state this lets the probe through."""
+        if self.state == CLOSED:
+            return True
+        if self.state == OPEN:
+            if time.monotonic() < self._open_until:
+                return False
+            self.state = HALF_OPEN
+            self._probing = False
+        if self._probing:
+            return False
+        self._probing = True
+        return True
+
+    def release(self):
+        """Let another probe through after the current one ended with
+        neither success() nor failure(), e.g. cancelled."""
+        if self.state == HALF_OPEN:
+            self._probing = False
+
+    def success(self):
+        """Record an answered request. Returns True if this closed the
+        breaker."""
+        recovered = self.state != CLOSED
+        self.state = CLOSED
+        self.failures = 0
+        self._pause = self.open_sec
+        self._probing = False
+        return recovered
+
+    def failure(self):
+        """Record a failed request. Returns True if this opened the
+        breaker."""
+        self.failures += 1
+        if self.state == HALF_OPEN:
+            self._pause = min(self.max_open_sec, self._pause * 2)
+        elif self.state == OPEN or self.failures < self.threshold:
+            return False
+        self.state = OPEN
+        self._probing = False
+        self._open_until = time.monotonic() + self._pause * random.uniform(
+            1, 1.5
+        )
+        return True
@@ -0,0 +1,121 @@
+"""Weekly schedules of the thermostats, cached by content version."""
+import copy
+import datetime
+import hashlib
+import json
+
+# Field of a thermostat holding its schedule, in responses and writes.
+SCHEDULE_FIELD = "Schedule"
+
+
+def schedule_version(data):
+    """Return a hash of schedule data, equal for equal schedules."""
+    text = json.dumps(data, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+class Schedule(object):
+    """Weekly schedule of one thermostat, as sent by the server.
+
+    The data is not modified once created, edit a copy from to_json()
+    and build a new Schedule from it.
+    """
+
+    __slots__ = ("data", "version")
+
+    def __init__(self, data):
+        self.data = data
+        self.version = schedule_version(data)
+
+    def to_json(self):
+        """Return a copy of the schedule data, safe to edit."""
+        return copy.deepcopy(self.data)
+
+    def events(self, weekday):
+        """Return the active (minute of the day, temperature) events of
+        weekday (0 is Monday), temperatures in degrees Celsius."""
+        events = []
+        for evt in self.data["Days"][weekday]["Events"]:
+            if evt["Active"]:
+                h, m, s = evt["Clock"].split(":")
+                events.append((int(h) * 60 + int(m), evt["Temperature"] / 100))
+        return events
+
+    def setpoint(self, now=None):
+        """Return the scheduled temperature at now (local time), None
+        if the schedule has no active events at all."""
+        if now is None:
+            now = datetime.datetime.now()
+        now_mins = now.hour * 60 + now.minute
+        weekday = now.weekday()
+        for mins, temp in reversed(self.events(weekday)):
+            if mins <= now_mins:
+                return temp
+        # Before the first event of the day, the last event of the
+        # previous days still applies.
+        for days in range(1, 8):
+            events = self.events((weekday - days) % 7)
+            if events:
+                return events[-1][1]
+        return None
+
+
+class ScheduleCache(object):
+    """Schedules of an account, by serial number.
+
+    Polls carry every schedule. update() compares them to the cached
+    data and only rebuilds the ones the server changed.
+    """
+
+    def __init__(self):
+        self._schedules = {}  # serial number -> Schedule
+
+    def get(self, serial):
+        return self._schedules.get(serial)
+
+    def versions(self):
+        """Return {serial number: version} of all cached schedules."""
+        return {sn: s.version for sn, s in self._schedules.items()}
+
+    def update(self, res):
+        """Update from a /api/thermostats response.
+
+        Returns the serial numbers whose schedule changed.
+        """
+        changed = []
+        seen = set()
+        for group in res["Groups"]:
+            for thermo in group.get("Thermostats", ()):
+                data = thermo.get(SCHEDULE_FIELD)
+                if data is None:
+                    continue
+                sn = thermo["SerialNumber"]
+                seen.add(sn)
+                if self.update_one(sn, data):
+                    changed.append(sn)
+        for sn in list(self._schedules):
+            if sn not in seen:
+                del self._schedules[sn]
+        return changed
+
+    def update_one(self, serial, data):
+        """Update the schedule of serial from polled data, returns True
+        if it changed."""
+        old = self._schedules.get(serial)
+        if old is not None and old.data == data:
+            return False
+        self._schedules[serial] = Schedule(data)
+        return True
+
+    def put(self, serial, schedule):
+        """Cache schedule as the current one of serial."""
+        self._schedules[serial] = schedule
+
+    def snapshot(self):
+        """Return the cached schedules as JSON data for restore()."""
+        return [[sn, s.data] for sn, s in self._schedules.items()]
+
+    def restore(self, data):
+        """Cache the schedules saved by snapshot(), unless known."""
+        for sn, schedule in data:
+            self._schedules.setdefault(sn, Schedule(schedule))
@@ -0,0 +1,188 @@
+"""Energy and diagnostic sensors of the UWG4 thermostats."""
+from datetime import timedelta
+
+from homeassistant.components.sensor import (
+    SensorDeviceClass,
+    SensorEntity,
+    SensorStateClass,
+)
+from homeassistant.const import (
+    EVENT_HOMEASSISTANT_STOP,
+    EntityCategory,
+    UnitOfEnergy,
+    UnitOfInformation,
+    UnitOfTime,
+)
+from homeassistant.core import callback
+from homeassistant.helpers.event import async_track_time_interval
+from homeassistant.util import slugify
+
+from .const import CONF_ENERGY, DOMAIN
+from .energy import EnergyHistory, EnergyStore
+from .metrics import _round
+
+ENERGY_DB = "uwg4_energy.db"
+# Energy is stored per hour, so there is no point syncing more often.
+ENERGY_SYNC_INTERVAL = timedelta(hours=1)
+
+# Diagnostic sensors of each account: key, name, unit, device class,
+# state class and the function reading the value from the client. They
+# only read counters kept in memory, so HA polls them.
+DIAGNOSTICS = (
+    (
+        "poll_duration", "poll duration", UnitOfTime.MILLISECONDS,
+        SensorDeviceClass.DURATION, SensorStateClass.MEASUREMENT,
+        lambda t: _round(t.metrics.last_poll_ms),
+    ),
+    (
+        "request_latency_p95", "request latency p95",
+        UnitOfTime.MILLISECONDS, SensorDeviceClass.DURATION,
+        SensorStateClass.MEASUREMENT,
+        lambda t: _round(max(
+            (h.quantile(0.95) for h in t.metrics.latency.values()),
+            default=None,
+        )),
+    ),
+    (
+        "response_size", "response size", UnitOfInformation.BYTES,
+        SensorDeviceClass.DATA_SIZE, SensorStateClass.MEASUREMENT,
+        lambda t: t.metrics.last_size,
+    ),
+    (
+        "logins", "logins", None, None, SensorStateClass.TOTAL_INCREASING,
+        lambda t: t.sessions.login_count,
+    ),
+    (
+        "retries", "retries", None, None, SensorStateClass.TOTAL_INCREASING,
+        lambda t: t.metrics.retries,
+    ),
+    (
+        "rate_budget", "rate budget", None, None,
+        SensorStateClass.MEASUREMENT,
+        lambda t: _round(t.bucket.tokens),
+    ),
+    (
+        "data_age", "data age", UnitOfTime.SECONDS,
+        SensorDeviceClass.DURATION, SensorStateClass.MEASUREMENT,
+        lambda t: _round(t.metrics.data_age()),
+    ),
+)
+
+
+async def async_setup_platform(
+    hass, config, async_add_entities, discovery_info=None
+):
+    """Set up the sensors, loaded by the climate platform."""
+    if discovery_info is None:
+        return
+    hub = hass.data[DOMAIN]["hub"]
+    async_add_entities(
+        UWG4DiagnosticSensor(account, *description)
+        for account in hub.accounts.values()
+        for description in DIAGNOSTICS
+    )
+    if discovery_info[CONF_ENERGY]:
+        await async_setup_energy(hass, hub, async_add_entities)
+
+
+async def async_setup_energy(hass, hub, async_add_entities):
+    """Add an energy sensor per thermostat, fed from the local store."""
+    store = await hass.async_add_executor_job(
+        EnergyStore, hass.config.path(ENERGY_DB)
+    )
+    unsubscribes = []
+
+    async def async_close(event):
+        for unsubscribe in unsubscribes:
+            unsubscribe()
+        await hass.async_add_executor_job(store.close)
+
+    hass.bus.async_listen_once(EVENT_HOMEASSISTANT_STOP, async_close)
+
+    for account in hub.accounts.values():
+        history = EnergyHistory(account, store)
+        add_sensors_on_change(hass, account, history, async_add_entities)
+        unsubscribes.append(async_track_time_interval(
+            hass, history.sync, ENERGY_SYNC_INTERVAL
+        ))
+        hass.async_create_background_task(
+            history.sync(), f"{DOMAIN} energy sync"
+        )
+
+
+def add_sensors_on_change(hass, account, history, async_add_entities):
+    """Add the sensors of the thermostats known now and of those that
+    appear later, remove those of thermostats that disappear."""
+    entities = {}  # serial number -> UWG4EnergySensor
+
+    @callback
+    def async_add(thermostats):
+        new = [UWG4EnergySensor(history, thermo) for thermo in thermostats]
+        for entity in new:
+            entities[entity.serial] = entity
+        if new:
+            async_add_entities(new)
+        return new
+
+    @callback
+    def async_registry_changed(added, removed):
+        if async_add(added):
+            # Download the history of the new thermostats.
+            hass.async_create_background_task(
+                history.sync(), f"{DOMAIN} energy sync"
+            )
+        for thermo in removed:
+            entity = entities.pop(thermo.serial, None)
+            if entity is not None:
+                hass.async_create_task(entity.async_remove())
+
+    async_add(account.thermostats.values())
+    account.add_registry_listener(async_registry_changed)
+
+
+class UWG4EnergySensor(SensorEntity):
+    """Total energy used by a thermostat, read from the local store."""
+
+    _attr_should_poll = False
+    _attr_device_class = SensorDeviceClass.ENERGY
+    _attr_state_class = SensorStateClass.TOTAL_INCREASING
+    _attr_native_unit_of_measurement = UnitOfEnergy.KILO_WATT_HOUR
+
+    def __init__(self, history, thermo):
+        self._history = history
+        self.serial = thermo.serial
+        self._attr_name = f"{thermo.name} energy"
+        self._attr_unique_id = f"{thermo.serial}_energy"
+
+    async def async_added_to_hass(self) -> None:
+        """Subscribe to the energy sync."""
+        self.async_on_remove(
+            self._history.add_listener(self.async_write_ha_state)
+        )
+
+    @property
+    def native_value(self):
+        """Return the total energy used."""
+        return self._history.totals.get(str(self.serial))
+
+
+class UWG4DiagnosticSensor(SensorEntity):
+    """Performance counter of an account."""
+
+    _attr_entity_category = EntityCategory.DIAGNOSTIC
+
+    def __init__(
+            self, account, key, name, unit, device_class, state_class,
+            value_fn
+    ):
+        self._account = account
+        self._value_fn = value_fn
+        self._attr_name = f"UWG4 {account.user} {name}"
+        self._attr_unique_id = f"{DOMAIN}_{slugify(account.user)}_{key}"
+        self._attr_native_unit_of_measurement = unit
+        self._attr_device_class = device_class
+        self._attr_state_class = state_class
+
+    @property
+    def native_value(self):
+        return self._value_fn(self._account)
@@ -0,0 +1,120 @@
+"""Session handling for a UWG4 cloud account."""
+import json
+import os
+import time
+
+from .flight import SingleFlight
+
+# Seconds after which a session is renewed in the background, before
+# the server expires it.
+SESSION_MAX_AGE_SEC = 12 * 60 * 60
+# Seconds during which no login is tried after a failed one, doubled per
+# failure in a row up to LOGIN_MAX_BACKOFF_SEC, so wrong credentials do
+# not get the account locked.
+LOGIN_BACKOFF_SEC = 60
+LOGIN_MAX_BACKOFF_SEC = 60 * 60
+
+
+class JsonStore(object):
+    """Minimal file store with the async_load/async_save interface of
+    Home Assistant's Store, for use outside Home Assistant."""
+
+    def __init__(self, path):
+        self.path = path
+
+    async def async_load(self):
+        try:
+            with open(self.path) as infile:
+                return json.load(infile)
+        except (OSError, ValueError):
+            return None
+
+    async def async_save(self, data):
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as outfile:
+            json.dump(data, outfile)
+        os.replace(tmp, self.path)
+
+
+class SessionManager(object):
+    """Keep one valid sessionId for an account.
+
+    authenticate is a coroutine function that logs in and returns the
+    new sessionId, or None on failure. Concurrent callers that need a
+    login share a single in-flight one. The sessionId is saved to store
+    (any object with async_load/async_save) so it survives restarts.
+    After a failed login no other is tried for a growing delay.
+    """
+
+    def __init__(self, authenticate, store=None, max_age=SESSION_MAX_AGE_SEC):
+        self._authenticate = authenticate
+        self.store = store
+        self.max_age = max_age
+        self.session_id = None
+        self.obtained = None  # time.time() of the login
+        self.login_count = 0
+        self.login_failures = 0  # in a row
+        self._retry_at = 0  # time.monotonic() of the next login allowed
+        self._login = SingleFlight(self._do_login)
+
+    async def load(self):
+        """Restore the sessionId saved by a previous run."""
+        if self.store is None or self.session_id is not None:
+            return
+        data = await self.store.async_load()
+        if data:
+            self.session_id = data.get("session_id")
+            self.obtained = data.get("obtained")
+
+    async def get(self):
+        """Return the current sessionId, logging in if there is none.
+
+        An old session is renewed in the background and kept in use
+        until the new one is available.
+        """
+        if self.session_id is None:
+            return await self.renew()
+        if self.obtained is None or time.time() - self.obtained > self.max_age:
+            self._login.start()
+        return self.session_id
+
+    async def renew(self, failed=None):
+        """Log in again and return the new sessionId.
+
+        failed is the sessionId the server rejected, it is not used
+        again. If it was already replaced by another caller the current
+        one is returned without logging in again. Returns None if the
+        login failed or is not allowed yet.
+        """
+        if failed is not None:
+            if failed == self.session_id:
+                self.session_id = None
+            elif self.session_id is not None:
+                return self.session_id
+        return await self._login()
+
+    @property
+    def retry_in(self):
+        """Seconds until a login is allowed again, 0 if it is now."""
+        return max(0.0, self._retry_at - time.monotonic())
+
+    async def _do_login(self):
+        if self.retry_in:
+            return None
+        self.login_count += 1
+        session_id = await self._authenticate()
+        if session_id is None:
+            self.login_failures += 1
+            self._retry_at = time.monotonic() + min(
+                LOGIN_MAX_BACKOFF_SEC,
+                LOGIN_BACKOFF_SEC * 2 ** (self.login_failures - 1),
+            )
+            return None
+        self.login_failures = 0
+        self.session_id = session_id
+        self.obtained = time.time()
+        if self.store is not None:
+            await self.store.async_save(
+                {"session_id": session_id, "obtained": self.obtained}
+            )
+        return session_id
@@ -0,0 +1,78 @@
+"""Per-thermostat change streams fed by the shared account poll."""
+import asyncio
+
+# Fields of a Thermostat reported in deltas.
+DELTA_FIELDS = (
+    "name",
+    "temperature",
+    "setpoint",
+    "heating",
+    "regmode",
+    "online",
+    "group",
+)
+
+
+class DeltaStream(object):
+    """Changes of the thermostats of a client, for one consumer.
+
+    The client only marks serial numbers as changed. The delta against
+    the state last handed to the consumer is computed when it asks for
+    it, so a slow consumer gets the changes of several polls merged in
+    one delta and memory stays bounded by the number of thermostats.
+
+    Iterating yields (serial number, {field: new value}), with None
+    instead of the dict when the thermostat was removed.
+    """
+
+    def __init__(self, client, serials=None, initial=False):
+        self._client = client
+        self._serials = None if serials is None else set(serials)
+        self._sent = {}  # serial number -> Thermostat last handed out
+        self._dirty = {}  # serial numbers to check, in order of change
+        self._event = asyncio.Event()
+        self.coalesced = 0  # changes merged into a pending delta
+        for sn, thermo in client.thermostats.items():
+            if self._wanted(sn):
+                if initial:
+                    self.mark(sn)
+                else:
+                    self._sent[sn] = thermo
+
+    def _wanted(self, serial):
+        return self._serials is None or serial in self._serials
+
+    def mark(self, serial):
+        """Note that thermostat serial may have changed."""
+        if not self._wanted(serial):
+            return
+        if serial in self._dirty:
+            self.coalesced += 1
+        self._dirty[serial] = None
+        self._event.set()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        while True:
+            while self._dirty:
+                sn = next(iter(self._dirty))
+                del self._dirty[sn]
+                old = self._sent.get(sn)
+                new = self._client.thermostats.get(sn)
+                if new is None:
+                    if old is not None:
+                        del self._sent[sn]
+                        return sn, None
+                    continue
+                self._sent[sn] = new
+                delta = {
+                    field: getattr(new, field)
+                    for field in DELTA_FIELDS
+                    if old is None or getattr(old, field) != getattr(new, field)
+                }
+                if delta:
+                    return sn, delta
+            self._event.clear()
+            await self._event.wait()
@@ -0,0 +1,120 @@
+"""Load benchmark of the UWG4 client against the local fake server.
+
+Measures poll latency, write throughput and login count as the number
+of thermostats and accounts grows, e.g.:
+    python benchmark.py --thermostats 10,100,500 --accounts 1,10
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", ".."))
+
+from uwg4.client import UWG4  # noqa: E402
+from uwg4.client import UWG4Hub  # noqa: E402
+
+import fake_server  # noqa: E402
+
+# The benchmark measures the client, not the rate limiter.
+UNLIMITED = 10 ** 6
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+async def bench(thermostats, accounts, args):
+    cloud = fake_server.FakeCloud(
+        thermostats, args.groups, args.latency, args.error_rate,
+        args.session_ttl,
+    )
+    runner, url = await fake_server.start(cloud)
+    hub = UWG4Hub(
+        host=url, rate_limit=UNLIMITED, rate_burst=UNLIMITED, write_delay=0
+    )
+    for i in range(accounts):
+        hub.add_account(f"user{i}@example.com", "password")
+    try:
+        start = time.perf_counter()
+        await hub.connect()
+        connect_time = time.perf_counter() - start
+
+        latencies = []
+
+        async def poll(account):
+            start = time.perf_counter()
+            await account.refresh()
+            latencies.append(time.perf_counter() - start)
+
+        for _ in range(args.polls):
+            await asyncio.gather(*(poll(a) for a in hub.accounts.values()))
+
+        targets = [
+            (account, sn)
+            for account in hub.accounts.values()
+            for sn in account.thermostats
+        ][:args.writes]
+        start = time.perf_counter()
+        await asyncio.gather(*(
+            account.setThermoTemperature(sn, UWG4.REGMODE_MANUAL, 2000)
+            for account, sn in targets
+        ))
+        write_time = time.perf_counter() - start
+
+        return {
+            "thermostats": thermostats,
+            "accounts": accounts,
+            "connect_s": round(connect_time, 3),
+            "poll_ms_mean": round(1000 * sum(latencies) / len(latencies), 2),
+            "poll_ms_p95": round(1000 * percentile(latencies, 0.95), 2),
+            "writes_per_s": round(len(targets) / write_time, 1),
+            "logins": cloud.logins,
+            "requests": sum(cloud.counts.values()),
+        }
+    finally:
+        await hub.close()
+        await runner.cleanup()
+
+
+async def run(args):
+    results = []
+    for accounts in args.accounts:
+        for thermostats in args.thermostats:
+            results.append(await bench(thermostats, accounts, args))
+    return results
+
+
+def int_list(value):
+    return [int(v) for v in value.split(",")]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--thermostats", type=int_list, default=[10, 100])
+    parser.add_argument("--accounts", type=int_list, default=[1, 10])
+    parser.add_argument("--groups", type=int, default=4)
+    parser.add_argument("--polls", type=int, default=20)
+    parser.add_argument("--writes", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--session-ttl", type=float, default=None)
+    parser.add_argument("--json", action="store_true", help="output JSON")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    keys = list(results[0])
+    print("  ".join(f"{k:>13}" for k in keys))
+    for result in results:
+        print("  ".join(f"{result[k]:>13}" for k in keys))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,239 @@
+"""Local stand-in for the mythermostat.info API, for load testing.
+
+Run standalone with:
+    python fake_server.py --thermostats 20 --groups 4 --port 8080
+and point the client at http://127.0.0.1:8080.
+"""
+
+import argparse
+import asyncio
+import datetime
+import random
+import time
+import uuid
+
+from aiohttp import web
+
+REGMODE_AUTO = 1
+REGMODE_COMFORT = 2
+REGMODE_MANUAL = 3
+REGMODE_VACATION = 4
+
+DATE_FORMAT = "%d/%m/%Y %H:%M:%S"
+
+
+def fake_schedule():
+    """Weekly schedule with the same four events every day."""
+    events = [
+        {"ScheduleType": 0, "Clock": clock, "Temperature": temp,
+         "Active": True}
+        for clock, temp in (
+            ("06:00:00", 2100), ("08:00:00", 1800),
+            ("16:00:00", 2100), ("22:00:00", 1800),
+        )
+    ]
+    return {
+        "Days": [
+            {"WeekDayGrpNo": day + 1, "Events": [dict(e) for e in events]}
+            for day in range(7)
+        ],
+        "ModifiedDueToVerification": False,
+    }
+
+
+class FakeAccount(object):
+    """Thermostats of one account, spread over groups."""
+
+    def __init__(self, index, thermostats, groups):
+        self.groups = {}
+        for i in range(thermostats):
+            group = f"Floor {i % max(1, groups)}"
+            sn = (index + 1) * 100000 + i
+            self.groups.setdefault(group, []).append({
+                "SerialNumber": str(sn),
+                "Room": f"Room {index}-{i}",
+                "RegulationMode": REGMODE_AUTO,
+                "Temperature": 2000 + random.randrange(-200, 200),
+                "SetPointTemp": 2100,
+                "ComfortTemperature": 2200,
+                "ComfortEndTime": "01/01/1970 00:00:00 +00:00",
+                "ManualTemperature": 2000,
+                "VacationEnabled": False,
+                "VacationTemperature": 1500,
+                "VacationBeginDay": "01/01/1970 00:00:00",
+                "VacationEndDay": "01/01/1970 00:00:00",
+                "Heating": False,
+                "Online": True,
+                "Schedule": fake_schedule(),
+            })
+        self.by_sn = {
+            t["SerialNumber"]: t
+            for members in self.groups.values()
+            for t in members
+        }
+
+    def churn(self, fraction):
+        """Change temperature and heating of a fraction of thermostats."""
+        count = int(len(self.by_sn) * fraction)
+        for thermo in random.sample(list(self.by_sn.values()), count):
+            thermo["Temperature"] += random.choice((-10, 10))
+            thermo["Heating"] = thermo["Temperature"] < thermo["SetPointTemp"]
+
+    def to_json(self):
+        return {
+            "Groups": [
+                {"GroupName": name, "Thermostats": members}
+                for name, members in self.groups.items()
+            ],
+            "ErrorCode": 0,
+        }
+
+
+class FakeCloud(object):
+    """The fake server. Accounts are created on their first login.
+
+    latency is added to every request (seconds), error_rate is the
+    chance of answering 500, sessions expire after session_ttl seconds
+    and churn is the fraction of thermostats changing between fetches.
+    """
+
+    def __init__(
+            self, thermostats=10, groups=2, latency=0.0, error_rate=0.0,
+            session_ttl=None, churn=0.1
+    ):
+        self.thermostats = thermostats
+        self.group_count = groups
+        self.latency = latency
+        self.error_rate = error_rate
+        self.session_ttl = session_ttl
+        self.churn = churn
+        self.accounts = {}  # email -> FakeAccount
+        self.sessions = {}  # sessionid -> (email, created)
+        self.counts = {}  # endpoint -> number of requests
+        self.logins = 0
+        self.writes = 0
+
+    def app(self):
+        app = web.Application()
+        app.router.add_post("/api/authenticate/user", self.authenticate)
+        app.router.add_get("/api/thermostats", self.get_thermostats)
+        app.router.add_get("/api/thermostat", self.get_thermostat)
+        app.router.add_post("/api/thermostat", self.set_thermostat)
+        app.router.add_get("/api/energyusage", self.get_energy)
+        return app
+
+    async def _begin(self, request):
+        path = request.path
+        self.counts[path] = self.counts.get(path, 0) + 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.error_rate and random.random() < self.error_rate:
+            raise web.HTTPInternalServerError()
+
+    def _account(self, request):
+        """Return the account of the request's session, None if invalid."""
+        session = self.sessions.get(request.query.get("sessionid"))
+        if session is None:
+            return None
+        email, created = session
+        if self.session_ttl and time.time() - created > self.session_ttl:
+            del self.sessions[request.query["sessionid"]]
+            return None
+        return self.accounts[email]
+
+    async def authenticate(self, request):
+        await self._begin(request)
+        data = await request.json()
+        email = data.get("Email")
+        if not email or not data.get("Password"):
+            return web.json_response({"ErrorCode": 1})
+        self.logins += 1
+        if email not in self.accounts:
+            self.accounts[email] = FakeAccount(
+                len(self.accounts), self.thermostats, self.group_count
+            )
+        session_id = uuid.uuid4().hex
+        self.sessions[session_id] = (email, time.time())
+        return web.json_response({"ErrorCode": 0, "SessionId": session_id})
+
+    async def get_thermostats(self, request):
+        await self._begin(request)
+        account = self._account(request)
+        if account is None:
+            raise web.HTTPForbidden()
+        account.churn(self.churn)
+        return web.json_response(account.to_json())
+
+    async def get_thermostat(self, request):
+        await self._begin(request)
+        account = self._account(request)
+        if account is None:
+            raise web.HTTPForbidden()
+        thermo = account.by_sn.get(request.query.get("serialnumber"))
+        if thermo is None:
+            return web.json_response({"ErrorCode": 2})
+        return web.json_response(dict(thermo, ErrorCode=0))
+
+    async def set_thermostat(self, request):
+        await self._begin(request)
+        account = self._account(request)
+        if account is None:
+            return web.json_response({"Success": False, "ErrorCode": 1})
+        thermo = account.by_sn.get(request.query.get("serialnumber"))
+        if thermo is None:
+            return web.json_response({"Success": False, "ErrorCode": 2})
+        data = await request.json()
+        for key, value in data.items():
+            if key in thermo:
+                thermo[key] = value
+        self.writes += 1
+        return web.json_response({"Success": True, "ErrorCode": 0})
+
+    async def get_energy(self, request):
+        await self._begin(request)
+        account = self._account(request)
+        if account is None:
+            raise web.HTTPForbidden()
+        if request.query.get("serialnumber") not in account.by_sn:
+            return web.json_response({"ErrorCode": 2})
+        start = datetime.datetime.strptime(request.query["from"], DATE_FORMAT)
+        end = datetime.datetime.strptime(request.query["to"], DATE_FORMAT)
+        usage = []
+        while start < end:
+            usage.append({
+                "Date": start.strftime(DATE_FORMAT),
+                "kWh": round(random.uniform(0, 0.5), 3),
+            })
+            start += datetime.timedelta(hours=1)
+        return web.json_response({"EnergyUsage": usage, "ErrorCode": 0})
+
+
+async def start(cloud, host="127.0.0.1", port=0):
+    """Serve cloud in the running loop, returns (runner, base url)."""
+    runner = web.AppRunner(cloud.app())
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    port = runner.addresses[0][1]
+    return runner, f"http://{host}:{port}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--thermostats", type=int, default=10)
+    parser.add_argument("--groups", type=int, default=2)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--session-ttl", type=float, default=None)
+    parser.add_argument("--churn", type=float, default=0.1)
+    args = parser.parse_args()
+    cloud = FakeCloud(
+        args.thermostats, args.groups, args.latency, args.error_rate,
+        args.session_ttl, args.churn,
+    )
+    web.run_app(cloud.app(), host="127.0.0.1", port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""Opt-in timing spans around the client and entity hot paths.
+
+Code marks phases with ``with TRACER.span("name"):``. Spans are only
+measured while a hook is installed, otherwise span() returns a shared
+no-op context manager. Hooks are called as hook(stack, duration,
+self_time) when a span ends, with stack the tuple of the names of the
+enclosing spans and the times in seconds.
+"""
+import collections
+import contextlib
+import contextvars
+import random
+import time
+
+# Spans kept by a SpanSampler.
+SAMPLE_SIZE = 5000
+
+_current = contextvars.ContextVar("uwg4_span", default=None)
+_NULL_SPAN = contextlib.nullcontext()
+
+
+class Span(object):
+    """One timed phase, nested in the span active when it started."""
+
+    __slots__ = ("tracer", "name", "stack", "start", "children", "_parent",
+                 "_token")
+
+    def __init__(self, tracer, name):
+        self.tracer = tracer
+        self.name = name
+
+    def __enter__(self):
+        parent = self._parent = _current.get()
+        if parent is None:
+            self.stack = (self.name,)
+        else:
+            self.stack = parent.stack + (self.name,)
+        self.children = 0.0
+        self._token = _current.set(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        duration = time.perf_counter() - self.start
+        _current.reset(self._token)
+        if self._parent is not None:
+            self._parent.children += duration
+        # Children running concurrently can add up to more than the span.
+        self.tracer._emit(
+            self.stack, duration, max(0.0, duration - self.children)
+        )
+        return False
+
+
+class Tracer(object):
+    """Creates spans and hands the finished ones to the hooks."""
+
+    def __init__(self):
+        self._hooks = []
+
+    @property
+    def enabled(self):
+        return bool(self._hooks)
+
+    def span(self, name):
+        """Return a context manager timing the phase name."""
+        if not self._hooks:
+            return _NULL_SPAN
+        return Span(self, name)
+
+    def add_hook(self, hook):
+        """Install hook, returns a function that removes it."""
+        self._hooks.append(hook)
+
+        def remove_hook():
+            self._hooks.remove(hook)
+
+        return remove_hook
+
+    def _emit(self, stack, duration, self_time):
+        for hook in list(self._hooks):
+            hook(stack, duration, self_time)
+
+    def trace_config(self):
+        """Return an aiohttp TraceConfig adding a "connect" span for new
+        connections (DNS, TCP and TLS), to pass to a ClientSession."""
+        import aiohttp
+
+        async def on_start(session, ctx, params):
+            ctx.span = self.span("connect")
+            ctx.span.__enter__()
+
+        async def on_end(session, ctx, params):
+            ctx.span.__exit__(None, None, None)
+
+        config = aiohttp.TraceConfig()
+        config.on_connection_create_start.append(on_start)
+        config.on_connection_create_end.append(on_end)
+        return config
+
+
+class SpanSampler(object):
+    """Hook keeping the last size spans, a rate fraction of them.
+
+    Use it with TRACER.add_hook(sampler).
+    """
+
+    def __init__(self, size=SAMPLE_SIZE, rate=1.0):
+        self.spans = collections.deque(maxlen=size)
+        self.rate = rate
+
+    def __call__(self, stack, duration, self_time):
+        if self.rate < 1 and random.random() >= self.rate:
+            return
+        self.spans.append((stack, duration, self_time))
+
+    def phases(self):
+        """Return {phase: {count, mean_ms, max_ms}} of the kept spans."""
+        times = {}
+        for stack, duration, self_time in self.spans:
+            times.setdefault(stack[-1], []).append(duration)
+        return {
+            name: {
+                "count": len(values),
+                "mean_ms": round(1000 * sum(values) / len(values), 2),
+                "max_ms": round(1000 * max(values), 2),
+            }
+            for name, values in times.items()
+        }
+
+    def folded(self):
+        """Return the kept spans as folded stacks ("a;b;c <us>" lines of
+        self time in microseconds), the input of flamegraph.pl and
+        speedscope. Call it on the event loop recording the spans."""
+        totals = collections.Counter()
+        for stack, duration, self_time in self.spans:
+            totals[";".join(stack)] += self_time
+        return "".join(
+            f"{stack} {round(1e6 * total)}\n"
+            for stack, total in sorted(totals.items())
+        )
+
+
+# Shared by all clients and entities.
+TRACER = Tracer()